@@ -17,9 +17,11 @@ import grading
 import importlib.util
 import optparse
 import os
+import pickle
 import pprint
 import re
 import sys
+import traceback
 import projectParams
 import random
 random.seed(0)
@@ -82,6 +84,11 @@ def readCommand(argv):
                       dest='noGraphics',
                       action='store_true',
                       help='No graphics display for pacman games.')
+    parser.add_option('--jobs', '-j',
+                      dest='jobs',
+                      type='int',
+                      default=1,
+                      help='Run test cases in this many worker processes, without graphics.')
     (options, args) = parser.parse_args(argv)
     return options
 
@@ -143,6 +150,19 @@ def loadModuleFile(moduleName, filePath):
     return module
 
 
+def loadModules(codeRoot, studentCode, testCaseCode):
+    "Loads the student code and the test classes, keyed by module name"
+    moduleDict = {}
+    for cp in studentCode.split(','):
+        moduleName = re.match('.*?([^/]*)\.py', cp).group(1)
+        moduleDict[moduleName] = loadModuleFile(
+            moduleName, os.path.join(codeRoot, cp))
+    moduleName = re.match('.*?([^/]*)\.py', testCaseCode).group(1)
+    moduleDict['projectTestClasses'] = loadModuleFile(
+        moduleName, os.path.join(codeRoot, testCaseCode))
+    return moduleDict
+
+
 def readFile(path, root=""):
     "Read file from disk at specified path and return as string"
     with open(os.path.join(root, path), 'r') as handle:
@@ -251,10 +271,185 @@ def getTestSubdirs(testParser, testRoot, questionToGrade):
     return sorted(os.listdir(testRoot))
 
 
+# load one test case of a question; returns None if it is disabled
+def loadTestCase(testParser, question, subdir_path, t):
+    test_file = os.path.join(subdir_path, '%s.test' % t)
+    solution_file = os.path.join(subdir_path, '%s.solution' % t)
+    test_out_file = os.path.join(subdir_path, '%s.test_output' % t)
+    testDict = testParser.TestParser(test_file).parse()
+    if testDict.get("disabled", "false").lower() == "true":
+        return None
+    testDict['test_out_file'] = test_out_file
+    testClass = getattr(projectTestClasses, testDict['class'])
+    return testClass(question, testDict), solution_file
+
+
+def makeTestThunk(testParser, testCase, solution_file, moduleDict,
+                  generateSolutions, printTestCase):
+    if generateSolutions:
+        # write solution file to disk
+        return lambda grades: testCase.writeSolution(moduleDict, solution_file)
+    else:
+        # read in solution dictionary and pass as an argument
+        testDict = testCase.testDict
+        solutionDict = testParser.TestParser(solution_file).parse()
+        if printTestCase:
+            return lambda grades: printTest(testDict, solutionDict) or testCase.execute(grades, moduleDict, solutionDict)
+        else:
+            return lambda grades: testCase.execute(grades, moduleDict, solutionDict)
+
+
+#######################################################################
+# Parallel test execution
+#######################################################################
+
+class RecordingGrades:
+    """
+    Stands in for grading.Grades while a test case runs in a worker
+    process: every call is recorded, to be replayed on the real Grades.
+    """
+
+    def __init__(self, events):
+        self.events = events
+
+    def __getattr__(self, name):
+        if not callable(getattr(grading.Grades, name, None)):
+            raise AttributeError(name)
+
+        def record(*args, **keyArgs):
+            self.events.append(('grade', name, args, keyArgs))
+        return record
+
+
+class RecordingWriter:
+    "Records what a test case prints, in order with its grading calls"
+
+    def __init__(self, events):
+        self.events = events
+
+    def write(self, text):
+        if self.events and self.events[-1][0] == 'write':
+            self.events[-1] = ('write', self.events[-1][1] + text)
+        else:
+            self.events.append(('write', text))
+
+    def flush(self):
+        pass
+
+
+class RemoteTraceback(Exception):
+    "Carries the traceback of an exception raised in a worker process"
+
+    def __str__(self):
+        return self.args[0]
+
+
+_workerModuleDict = None
+
+
+def _initTestWorker(codeRoot, studentCode, testCaseCode):
+    global _workerModuleDict
+    _workerModuleDict = loadModules(codeRoot, studentCode, testCaseCode)
+    for module in _workerModuleDict:
+        setattr(sys.modules[__name__], module, _workerModuleDict[module])
+
+
+def _runTestInWorker(testRoot, q, t, generateSolutions, printTestCase):
+    """
+    Runs one test case and returns the events it produced: its output,
+    its grading calls and finally its result or exception.
+    """
+    import testParser
+    import testClasses
+    import textDisplay
+    subdir_path = os.path.join(testRoot, q)
+    questionDict = testParser.TestParser(
+        os.path.join(subdir_path, 'CONFIG')).parse()
+    questionClass = getattr(testClasses, questionDict['class'])
+    question = questionClass(questionDict, textDisplay.NullGraphics())
+    testCase, solution_file = loadTestCase(
+        testParser, question, subdir_path, t)
+    thunk = makeTestThunk(testParser, testCase, solution_file,
+                          _workerModuleDict, generateSolutions, printTestCase)
+
+    events = []
+    stdout = sys.stdout
+    sys.stdout = RecordingWriter(events)
+    try:
+        events.append(('return', thunk(RecordingGrades(events))))
+    except BaseException as inst:
+        try:
+            pickle.dumps(inst)
+        except Exception:
+            inst = Exception(str(inst))
+        events.append(('raise', inst, traceback.format_exc()))
+    finally:
+        sys.stdout = stdout
+    return events
+
+
+def replayTestEvents(events, grades):
+    "Replays the events of a test case on grades, as if it ran here"
+    for event in events:
+        if event[0] == 'write':
+            sys.stdout.write(event[1])
+        elif event[0] == 'grade':
+            getattr(grades, event[1])(*event[2], **event[3])
+        elif event[0] == 'return':
+            return event[1]
+        else:
+            raise event[1] from RemoteTraceback(event[2])
+
+
+class ParallelTestRunner:
+    """
+    Runs test cases in a pool of worker processes while Grades.grade walks
+    the questions in their usual order.  Each test case's thunk waits for
+    its own result and replays it, so points, messages and output come out
+    exactly as in a serial run (only tracebacks show the worker's stack).
+
+    Tests of questions without prerequisites are all submitted up front;
+    those of a question with 'depends' are submitted only once grading
+    reaches it, that is once its prerequisites are complete.
+    """
+
+    def __init__(self, pool, testRoot, generateSolutions=False, printTestCase=False):
+        self.pool = pool
+        self.testRoot = testRoot
+        self.generateSolutions = generateSolutions
+        self.printTestCase = printTestCase
+        self.tests = {}
+        self.depends = {}
+        self.futures = {}
+
+    def setDepends(self, q, prereqs):
+        self.depends[q] = prereqs
+
+    def makeThunk(self, q, t):
+        self.tests.setdefault(q, []).append(t)
+        return lambda grades: self.runTest(q, t, grades)
+
+    def start(self):
+        for q in self.tests:
+            if not self.depends.get(q):
+                self.submit(q)
+
+    def submit(self, q):
+        for t in self.tests[q]:
+            self.futures[(q, t)] = self.pool.submit(
+                _runTestInWorker, self.testRoot, q, t,
+                self.generateSolutions, self.printTestCase)
+
+    def runTest(self, q, t, grades):
+        if (q, t) not in self.futures:
+            self.submit(q)
+        return replayTestEvents(self.futures[(q, t)].result(), grades)
+
+
 # evaluate student code
 def evaluate(generateSolutions, testRoot, moduleDict, exceptionMap=ERROR_HINT_MAP,
              edxOutput=False, muteOutput=False, gsOutput=False,
-             printTestCase=False, questionToGrade=None, display=None):
+             printTestCase=False, questionToGrade=None, display=None, runner=None):
     # imports of testbench code.  note that the testClasses import must follow
     # the import of student code due to dependencies
     import testParser
@@ -276,35 +471,25 @@ def evaluate(generateSolutions, testRoot, moduleDict, exceptionMap=ERROR_HINT_MA
         questionClass = getattr(testClasses, questionDict['class'])
         question = questionClass(questionDict, display)
         questionDicts[q] = questionDict
+        if runner is not None:
+            runner.setDepends(q, questionDict.get('depends', '').split()
+                              if questionToGrade == None else [])
 
         # load test cases into question
         tests = [t for t in os.listdir(
             subdir_path) if re.match('[^#~.].*\.test\Z', t)]
         tests = [re.match('(.*)\.test\Z', t).group(1) for t in tests]
         for t in sorted(tests):
-            test_file = os.path.join(subdir_path, '%s.test' % t)
-            solution_file = os.path.join(subdir_path, '%s.solution' % t)
-            test_out_file = os.path.join(subdir_path, '%s.test_output' % t)
-            testDict = testParser.TestParser(test_file).parse()
-            if testDict.get("disabled", "false").lower() == "true":
+            loaded = loadTestCase(testParser, question, subdir_path, t)
+            if loaded is None:
                 continue
-            testDict['test_out_file'] = test_out_file
-            testClass = getattr(projectTestClasses, testDict['class'])
-            testCase = testClass(question, testDict)
-
-            def makefun(testCase, solution_file):
-                if generateSolutions:
-                    # write solution file to disk
-                    return lambda grades: testCase.writeSolution(moduleDict, solution_file)
-                else:
-                    # read in solution dictionary and pass as an argument
-                    testDict = testParser.TestParser(test_file).parse()
-                    solutionDict = testParser.TestParser(solution_file).parse()
-                    if printTestCase:
-                        return lambda grades: printTest(testDict, solutionDict) or testCase.execute(grades, moduleDict, solutionDict)
-                    else:
-                        return lambda grades: testCase.execute(grades, moduleDict, solutionDict)
-            question.addTestCase(testCase, makefun(testCase, solution_file))
+            testCase, solution_file = loaded
+            if runner is not None:
+                question.addTestCase(testCase, runner.makeThunk(q, t))
+            else:
+                question.addTestCase(testCase, makeTestThunk(
+                    testParser, testCase, solution_file, moduleDict,
+                    generateSolutions, printTestCase))
 
         # Note extra function is necessary for scoping reasons
         def makefun(question):
@@ -319,6 +504,8 @@ def evaluate(generateSolutions, testRoot, moduleDict, exceptionMap=ERROR_HINT_MA
             for prereq in questionDicts[q].get('depends', '').split():
                 grades.addPrereq(q, prereq)
 
+    if runner is not None:
+        runner.start()
     grades.grade(sys.modules[__name__], bonusPic=projectParams.BONUS_PIC)
     return grades.points
 
@@ -341,20 +528,26 @@ if __name__ == '__main__':
     options = readCommand(sys.argv)
     if options.generateSolutions:
         confirmGenerate()
-    codePaths = options.studentCode.split(',')
-
-    moduleDict = {}
-    for cp in codePaths:
-        moduleName = re.match('.*?([^/]*)\.py', cp).group(1)
-        moduleDict[moduleName] = loadModuleFile(
-            moduleName, os.path.join(options.codeRoot, cp))
-    moduleName = re.match('.*?([^/]*)\.py', options.testCaseCode).group(1)
-    moduleDict['projectTestClasses'] = loadModuleFile(
-        moduleName, os.path.join(options.codeRoot, options.testCaseCode))
+    moduleDict = loadModules(options.codeRoot, options.studentCode,
+                             options.testCaseCode)
 
     if options.runTest != None:
         runTest(options.runTest, moduleDict, printTestCase=options.printTestCase,
                 display=getDisplay(True, options))
+    elif options.jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(options.jobs, initializer=_initTestWorker,
+                                   initargs=(options.codeRoot, options.studentCode,
+                                             options.testCaseCode))
+        try:
+            runner = ParallelTestRunner(pool, options.testRoot, options.generateSolutions,
+                                        options.printTestCase)
+            evaluate(options.generateSolutions, options.testRoot, moduleDict,
+                     gsOutput=options.gsOutput,
+                     edxOutput=options.edxOutput, muteOutput=options.muteOutput, printTestCase=options.printTestCase,
+                     questionToGrade=options.gradeQuestion, display=getDisplay(False), runner=runner)
+        finally:
+            pool.shutdown(cancel_futures=True)
     else:
         evaluate(options.generateSolutions, options.testRoot, moduleDict,
                  gsOutput=options.gsOutput,
@@ -0,0 +1,387 @@
+# benchmark.py
+# ------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+"""
+Engine benchmarks.
+
+Micro-benchmarks time the hot paths of the engine (successor generation,
+legal actions, state hashing, grid operations and layout loading) in
+operations per second.  Macro-benchmarks play whole headless games of
+MinimaxAgent at several depths on every layout and report moves and
+successors per second, and whether each game finished within the
+--budget safety limit.
+
+  python benchmark.py -o baseline.json            # run everything
+  python benchmark.py --micro -o new.json         # micro-benchmarks only
+  python benchmark.py --compare baseline.json     # run, then compare
+  python benchmark.py --compare baseline.json --results new.json
+
+Comparing flags every throughput that dropped by more than --threshold
+(a fraction) and exits with status 1 if there was any.
+
+Generated mazes (see mazeGenerator.py) chart how startup time,
+throughput and memory grow with the board and the number of ghosts:
+
+  python benchmark.py --macro --layouts none --mazes 50,100,200 --memory
+  python benchmark.py --macro --layouts none --mazes 200,1000 --mazeGhosts 200 --depths none
+"""
+
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import layout
+from game import Grid
+from game import BitGrid
+from pacman import GameState
+
+# Keys of the results that measure throughput (higher is better)
+THROUGHPUT_KEYS = ('opsPerSec', 'successorsPerSec')
+
+
+def getMachineInfo():
+    info = {'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpuCount': os.cpu_count(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': None}
+    try:
+        info['commit'] = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+
+def timeOperation(operation, opsPerCall, minTime=0.2, repeat=3):
+    """
+    Returns the best operations per second over repeat runs of at least
+    minTime seconds each.  operation() does opsPerCall operations.
+    """
+    best = 0.0
+    for r in range(repeat):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            operation()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= minTime:
+                break
+        GameState.getAndResetExplored()
+        best = max(best, calls * opsPerCall / elapsed)
+    return best
+
+
+def sampleStates(layoutName='mediumClassic', numStates=200, seed=0):
+    """
+    States from a random game, restarted whenever it ends.
+    """
+    rng = random.Random(seed)
+    board = layout.getLayout(layoutName)
+    states = []
+    state = None
+    agentIndex = 0
+    while len(states) < numStates:
+        if state is None or state.isWin() or state.isLose():
+            state = GameState()
+            state.initialize(board, board.getNumGhosts())
+            agentIndex = 0
+        states.append(state)
+        action = rng.choice(state.getLegalActions(agentIndex))
+        state = state.generateSuccessor(agentIndex, action, explore=False)
+        agentIndex = (agentIndex + 1) % state.getNumAgents()
+    return states
+
+
+def runMicro(minTime=0.2, repeat=3):
+    states = sampleStates()
+    moves = []
+    for state in states:
+        for agentIndex in range(state.getNumAgents()):
+            for action in state.getLegalActions(agentIndex):
+                moves.append((state, agentIndex, action))
+
+    def successors():
+        for state, agentIndex, action in moves:
+            state.generateSuccessor(agentIndex, action)
+
+    def legalActions():
+        for state in states:
+            for agentIndex in range(state.getNumAgents()):
+                state.getLegalActions(agentIndex)
+
+    def hashes():
+        for state in states:
+            hash(state.data)
+
+    board = layout.getLayout('originalClassic')
+    bitGrid = board.food
+    grid = Grid(bitGrid.width, bitGrid.height)
+    for x, y in bitGrid.asList():
+        grid[x][y] = True
+    numAgents = states[0].getNumAgents()
+
+    # Loading through a fresh registry each call, so neither the in-memory
+    # cache nor a remembered path applies; the first load writes the
+    # compiled file the others read.
+    layoutPath = layout.REGISTRY.resolve('originalClassic')
+    f = open(layoutPath)
+    try:
+        layoutText = [line.strip() for line in f]
+    finally:
+        f.close()
+    layout.LayoutRegistry().load(layoutPath)
+
+    def uncachedAsList():
+        # A fresh grid, so BitGrid's asList memo does not apply
+        fresh = BitGrid(bitGrid.width, bitGrid.height)
+        fresh.bits = bitGrid.bits
+        return fresh.asList()
+
+    benchmarks = [
+        ('GameState.generateSuccessor', successors, len(moves)),
+        ('GameState.getLegalActions', legalActions, len(states) * numAgents),
+        ('GameStateData.__hash__', hashes, len(states)),
+        ('Grid.copy', grid.copy, 1),
+        ('Grid.count', grid.count, 1),
+        ('Grid.asList', grid.asList, 1),
+        ('BitGrid.copy', bitGrid.copy, 1),
+        ('BitGrid.count', bitGrid.count, 1),
+        ('BitGrid.asList', uncachedAsList, 1),
+        ('BitGrid.asList (memoized)', bitGrid.asList, 1),
+        ('Layout parsing', lambda: layout.Layout(layoutText), 1),
+        ('Layout loading (text)', lambda: layout.LayoutRegistry(False).load(layoutPath), 1),
+        ('Layout loading (compiled)', lambda: layout.LayoutRegistry().load(layoutPath), 1),
+        ('Layout lookup (cached)', lambda: layout.getLayout('originalClassic'), 1),
+    ]
+    results = {}
+    for name, operation, opsPerCall in benchmarks:
+        results[name] = {'opsPerSec': timeOperation(operation, opsPerCall, minTime, repeat)}
+        print('%-30s %14.0f ops/s' % (name, results[name]['opsPerSec']))
+    return results
+
+
+def playHeadless(board, agent, ghosts, maxMoves, budget, seed=0, traceMemory=False):
+    """
+    Plays a headless game until it ends, Pacman has made maxMoves moves (0
+    for no limit) or budget seconds have passed, and returns its
+    throughput; finished tells whether the game ran to a win or a loss.
+    traceMemory adds the peak memory allocated during the game, measured
+    with tracemalloc, which slows the game down.
+    """
+    if traceMemory:
+        import tracemalloc
+        tracemalloc.start()
+    random.seed(seed)
+    agents = [agent] + ghosts[:board.getNumGhosts()]
+    state = GameState()
+    state.initialize(board, len(agents) - 1)
+    agent.registerInitialState(state)
+    startSuccessors = GameState.numSuccessors
+    start = time.perf_counter()
+    moves = 0
+    agentIndex = 0
+    while not (state.isWin() or state.isLose()):
+        if agentIndex == 0:
+            if moves == maxMoves > 0 or time.perf_counter() - start >= budget:
+                break
+            moves += 1
+        action = agents[agentIndex].getAction(state)
+        state = state.generateSuccessor(agentIndex, action)
+        agentIndex = (agentIndex + 1) % len(agents)
+    elapsed = time.perf_counter() - start
+    GameState.getAndResetExplored()
+    successors = GameState.numSuccessors - startSuccessors
+    result = {'moves': moves,
+              'seconds': elapsed,
+              'successors': successors,
+              'movesPerSec': moves / elapsed,
+              'successorsPerSec': successors / elapsed,
+              'score': state.getScore(),
+              'finished': state.isWin() or state.isLose(),
+              'cells': board.width * board.height,
+              'ghosts': len(agents) - 1}
+    if traceMemory:
+        result['peakMemory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def timeStartup(layoutName):
+    """
+    Times what happens before the first move on a layout: loading (or
+    generating) it, building the first GameState and one round of legal
+    actions and successors, which builds the layout's action table.
+    Layouts already loaded in this process only time the later steps.
+    """
+    start = time.perf_counter()
+    board = layout.getLayout(layoutName)
+    loaded = time.perf_counter()
+    state = GameState()
+    state.initialize(board, board.getNumGhosts())
+    initialized = time.perf_counter()
+    for agentIndex in range(state.getNumAgents()):
+        state = state.generateSuccessor(agentIndex, state.getLegalActions(agentIndex)[0])
+    end = time.perf_counter()
+    return board, {'layoutSeconds': loaded - start,
+                   'stateSeconds': initialized - loaded,
+                   'firstRoundSeconds': end - initialized,
+                   'startupSeconds': end - start,
+                   'cells': board.width * board.height,
+                   'ghosts': board.getNumGhosts()}
+
+
+def runMacro(depths, layoutNames, maxMoves, budget, traceMemory=False):
+    import ghostAgents
+    import seuPacManAgents
+    results = {}
+    for layoutName in layoutNames:
+        board, startup = timeStartup(layoutName)
+        results['%s/startup' % layoutName] = startup
+        print('%-30s %8.2f s startup (layout %.2f, state %.2f, first round %.2f)' % (
+            '%s/startup' % layoutName, startup['startupSeconds'], startup['layoutSeconds'],
+            startup['stateSeconds'], startup['firstRoundSeconds']))
+        for depth in depths:
+            agent = seuPacManAgents.MinimaxAgent(depth=str(depth))
+            ghosts = [ghostAgents.RandomGhost(i + 1) for i in range(board.getNumGhosts())]
+            name = '%s/depth%d' % (layoutName, depth)
+            results[name] = playHeadless(board, agent, ghosts, maxMoves, budget,
+                                         traceMemory=traceMemory)
+            memory = ''
+            if traceMemory:
+                memory = ' %8.1f MB peak' % (results[name]['peakMemory'] / 1e6)
+            print('%-30s %5d moves %-8s %10.1f moves/s %12.0f successors/s%s' % (
+                name, results[name]['moves'],
+                results[name]['finished'] and 'finished' or 'stopped',
+                results[name]['movesPerSec'], results[name]['successorsPerSec'], memory))
+    return results
+
+
+def getLayoutNames():
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layouts')
+    return sorted(f[:-4] for f in os.listdir(directory) if f.endswith('.lay'))
+
+
+def compareResults(baseline, results, threshold):
+    """
+    Prints how every throughput changed from baseline to results and
+    returns the names of those that regressed by more than threshold.
+    """
+    regressions = []
+    for section in ('micro', 'macro'):
+        old, new = baseline.get(section, {}), results.get(section, {})
+        for name in sorted(set(old) & set(new)):
+            for key in THROUGHPUT_KEYS:
+                if key not in old[name] or key not in new[name] or not old[name][key]:
+                    continue
+                ratio = new[name][key] / old[name][key]
+                flag = ''
+                if ratio < 1 - threshold:
+                    flag = 'REGRESSION'
+                    regressions.append('%s %s' % (name, key))
+                print('%-30s %-16s %14.1f %14.1f %7.2fx %s' % (
+                    name, key, old[name][key], new[name][key], ratio, flag))
+    return regressions
+
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser(__doc__)
+    parser.add_option('--micro', action='store_true', dest='micro', default=False,
+                      help='Run the micro-benchmarks (both kinds run if neither is given)')
+    parser.add_option('--macro', action='store_true', dest='macro', default=False,
+                      help='Run the macro-benchmarks')
+    parser.add_option('-o', '--output', dest='output', default=None,
+                      help='Write the results to this JSON file')
+    parser.add_option('--depths', dest='depths', default='2,3,4',
+                      help='Comma separated MinimaxAgent depths, or none to time only startup [Default: %default]')
+    parser.add_option('--layouts', dest='layouts', default=None,
+                      help='Comma separated layouts, or none [Default: every file in layouts/]')
+    parser.add_option('--mazes', dest='mazes', default=None,
+                      help='Comma separated sizes N of generated NxN mazes to add to the layouts')
+    parser.add_option('--mazeGhosts', dest='mazeGhosts', type='int', default=4,
+                      help='Ghosts in each generated maze [Default: %default]')
+    parser.add_option('--memory', action='store_true', dest='memory', default=False,
+                      help='Record the peak memory of each macro game (slows them down)')
+    parser.add_option('--maxMoves', dest='maxMoves', type='int', default=0,
+                      help='Pacman moves per macro game at most, 0 for whole games [Default: %default]')
+    parser.add_option('--budget', dest='budget', type='float', default=60.0,
+                      help='Safety limit in seconds per macro game, checked between moves [Default: %default]')
+    parser.add_option('--minTime', dest='minTime', type='float', default=0.2,
+                      help='Seconds per micro-benchmark run [Default: %default]')
+    parser.add_option('--compare', dest='compare', default=None,
+                      help='A baseline JSON file to compare the results against')
+    parser.add_option('--results', dest='results', default=None,
+                      help='With --compare, compare this JSON file instead of running')
+    parser.add_option('--threshold', dest='threshold', type='float', default=0.1,
+                      help='Slowdown that counts as a regression [Default: %default]')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+
+def main(argv):
+    options = readCommand(argv)
+    if options.compare and options.results:
+        results = json.load(open(options.results))
+    else:
+        runBoth = not options.micro and not options.macro
+        results = {'machine': getMachineInfo()}
+        if options.micro or runBoth:
+            results['micro'] = runMicro(options.minTime)
+        if options.macro or runBoth:
+            layoutNames = getLayoutNames()
+            if options.layouts == 'none':
+                layoutNames = []
+            elif options.layouts:
+                layoutNames = options.layouts.split(',')
+            if options.mazes:
+                layoutNames += ['maze:%sx%s:ghosts=%d' % (n, n, options.mazeGhosts)
+                                for n in options.mazes.split(',')]
+            depths = []
+            if options.depths != 'none':
+                depths = [int(d) for d in options.depths.split(',')]
+            results['macro'] = runMacro(depths, layoutNames, options.maxMoves,
+                                        options.budget, options.memory)
+        if options.output:
+            f = open(options.output, 'w')
+            try:
+                json.dump(results, f, indent=2, sort_keys=True)
+            finally:
+                f.close()
+
+    if options.compare:
+        baseline = json.load(open(options.compare))
+        if baseline.get('machine', {}).get('platform') != results.get('machine', {}).get('platform'):
+            print('Warning: the baseline was measured on a different machine')
+        regressions = compareResults(baseline, results, options.threshold)
+        if regressions:
+            print('%d regressions beyond %d%%: %s' % (
+                len(regressions), options.threshold * 100, ', '.join(regressions)))
+            return 1
+        print('No regressions beyond %d%%' % (options.threshold * 100))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,260 @@
+# gameRecords.py
+# --------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+"""
+Compact, streaming game recordings, and seekable replays of them.
+
+A recording is a binary file made of:
+
+  MAGIC                       identifies the format and its version
+  one JSON header line        layout hash, seed and agent names
+  one byte per move           agentIndex << 3 | action code
+  KEYFRAME records            every keyframeInterval moves, the state
+                              before that move: KEYFRAME, a 4-byte length
+                              and a compressed GameStateData.pack()
+  END_OF_MOVES + JSON line    the final score, once the game is over
+
+Moves are written as they are made, so a game that crashes or is killed
+still leaves a readable file; it just has no footer.  Keyframes let a
+Replay reach any move by unpacking the nearest earlier keyframe and
+applying at most keyframeInterval moves.
+
+Run this module to print the state at a given move of many recordings:
+
+  python gameRecords.py --move 500 recorded-game-*.rec
+"""
+
+import ast
+import bisect
+import json
+import re
+import struct
+import sys
+import zlib
+from game import Directions
+from game import GameStateData
+
+MAGIC = b'PACREC 1\n'
+END_OF_MOVES = 0xFF
+KEYFRAME = 0xFE
+KEYFRAME_INTERVAL = 200
+
+ACTIONS = [Directions.NORTH, Directions.SOUTH,
+           Directions.EAST, Directions.WEST, Directions.STOP]
+ACTION_CODES = dict((action, code) for code, action in enumerate(ACTIONS))
+# A move byte has five bits for the agent index.  Action codes stop at 4,
+# so no move byte can be KEYFRAME or END_OF_MOVES.
+MAX_AGENTS = 31
+_MARKER = re.compile(b'[\xfe\xff]')
+
+
+class GameRecorder:
+    """
+    Writes the recording of one game.  Game.run calls recordMove with each
+    move and the state it is made from when the game's recorder is set;
+    finish writes the footer.
+    """
+
+    def __init__(self, fname, layout, agents, seed=None, keyframeInterval=KEYFRAME_INTERVAL):
+        if len(agents) > MAX_AGENTS:
+            raise Exception('Recordings hold at most %d agents' % MAX_AGENTS)
+        header = {'layoutHash': layout.getContentHash(),
+                  'seed': seed,
+                  'agents': [agent.__class__.__name__ for agent in agents],
+                  'keyframeInterval': keyframeInterval}
+        self.fname = fname
+        self.keyframeInterval = keyframeInterval
+        self.numMoves = 0
+        self.file = open(fname, 'wb')
+        self.file.write(MAGIC)
+        self.file.write(json.dumps(header).encode() + b'\n')
+
+    def recordMove(self, agentIndex, action, state):
+        if self.keyframeInterval and self.numMoves % self.keyframeInterval == 0:
+            payload = zlib.compress(repr(state.data.pack()).encode())
+            self.file.write(bytes((KEYFRAME,)) + struct.pack('>I', len(payload)))
+            self.file.write(payload)
+        self.file.write(bytes((agentIndex << 3 | ACTION_CODES[action],)))
+        self.numMoves += 1
+
+    def finish(self, game=None):
+        """
+        Closes the file, with a footer holding the result if the game given
+        is over.
+        """
+        if self.file is None:
+            return
+        if game is not None and game.gameOver:
+            footer = {'score': game.state.getScore(),
+                      'win': game.state.isWin(),
+                      'crashed': game.agentCrashed,
+                      'timeout': game.agentTimeout}
+            self.file.write(bytes((END_OF_MOVES,)))
+            self.file.write(json.dumps(footer).encode() + b'\n')
+        self.file.close()
+        self.file = None
+
+
+class GameRecord:
+    """
+    A recording read back from disk.  header and footer are dicts (footer
+    is None for a game that never finished), actions is a list of
+    (agentIndex, action) pairs, like Game.moveHistory, and keyframes maps
+    move indices to packed states (see GameStateData.pack).
+    """
+
+    def __init__(self, header, actions, footer, keyframes=None):
+        self.header = header
+        self.actions = actions
+        self.footer = footer
+        self.keyframes = keyframes or {}
+
+    def isComplete(self):
+        return self.footer is not None
+
+
+def isRecording(fname):
+    f = open(fname, 'rb')
+    try:
+        return f.read(len(MAGIC)) == MAGIC
+    finally:
+        f.close()
+
+
+def readRecording(fname):
+    f = open(fname, 'rb')
+    try:
+        data = f.read()
+    finally:
+        f.close()
+    if not data.startswith(MAGIC):
+        raise Exception('%s is not a game recording' % fname)
+    start = len(MAGIC)
+    end = data.index(b'\n', start)
+    header = json.loads(data[start:end].decode())
+    actions = []
+    keyframes = {}
+    footer = None
+    pos = end + 1
+    while pos < len(data):
+        # Moves run up to the next keyframe or the footer.
+        marker = _MARKER.search(data, pos)
+        stop = marker.start() if marker else len(data)
+        actions.extend([(byte >> 3, ACTIONS[byte & 7]) for byte in data[pos:stop]])
+        if stop == len(data):
+            break
+        if data[stop] == END_OF_MOVES:
+            footer = json.loads(data[stop + 1:].decode())
+            break
+        if stop + 5 > len(data):
+            break
+        length = struct.unpack('>I', data[stop + 1:stop + 5])[0]
+        payload = data[stop + 5:stop + 5 + length]
+        if len(payload) < length:
+            # A keyframe cut short by a crash
+            break
+        keyframes[len(actions)] = ast.literal_eval(zlib.decompress(payload).decode())
+        pos = stop + 5 + length
+    return GameRecord(header, actions, footer, keyframes)
+
+
+class Replay:
+    """
+    Random access to the states of a recorded game on its layout.
+    getState(i) is the state before move i (getState(len(actions)) is the
+    final state); it costs at most a keyframe interval of moves, and
+    moving forward from the last state returned costs only the moves in
+    between, so scrubbing either way stays cheap.
+    """
+
+    def __init__(self, record, layout):
+        self.record = record
+        self.layout = layout
+        self.actions = record.actions
+        self.keyframeIndices = sorted(record.keyframes)
+        self.current = None
+        self.currentIndex = None
+
+    def getNumMoves(self):
+        return len(self.actions)
+
+    def getState(self, moveIndex):
+        import pacman
+        if moveIndex < 0 or moveIndex > len(self.actions):
+            raise Exception('Move %d is outside this game (0-%d)' %
+                            (moveIndex, len(self.actions)))
+        # Start from the nearest keyframe, or from the current state if that
+        # is closer, or from the beginning.
+        k = bisect.bisect_right(self.keyframeIndices, moveIndex) - 1
+        if self.currentIndex is not None and self.currentIndex <= moveIndex and (
+                k < 0 or self.currentIndex >= self.keyframeIndices[k]):
+            state, index = self.current, self.currentIndex
+        elif k >= 0:
+            index = self.keyframeIndices[k]
+            state = pacman.GameState()
+            state.data = GameStateData.unpack(self.layout, self.record.keyframes[index])
+        else:
+            index = 0
+            state = pacman.GameState()
+            state.initialize(self.layout, len(self.record.header['agents']) - 1)
+        while index < moveIndex:
+            state = state.generateSuccessor(*self.actions[index], explore=False)
+            index += 1
+        self.current, self.currentIndex = state, index
+        return state
+
+
+def loadReplay(fname, layouts=None):
+    """
+    Reads a recording and finds its layout by content hash.  layouts is an
+    optional dict from hash to Layout, shared across calls to save loading
+    the same layout again.
+    """
+    import layout
+    record = readRecording(fname)
+    contentHash = record.header['layoutHash']
+    if layouts is None:
+        layouts = {}
+    if contentHash not in layouts:
+        layouts[contentHash] = layout.findLayoutByHash(contentHash)
+    if layouts[contentHash] == None:
+        raise Exception('The layout of %s cannot be found' % fname)
+    return Replay(record, layouts[contentHash])
+
+
+def extractStates(fnames, moveIndex):
+    """
+    Yields (fname, state) with the state before move moveIndex of each
+    recording, or the final state of games that ended earlier.  Nothing is
+    displayed, so this runs through large batches of recordings quickly.
+    """
+    layouts = {}
+    for fname in fnames:
+        replay = loadReplay(fname, layouts)
+        yield fname, replay.getState(min(moveIndex, replay.getNumMoves()))
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python gameRecords.py --move N RECORDING...')
+    parser.add_option('-m', '--move', dest='move', type='int', default=0,
+                      help='The move to extract the state at [Default: %default]')
+    options, fnames = parser.parse_args(sys.argv[1:])
+    for fname, state in extractStates(fnames, options.move):
+        print(json.dumps({'file': fname,
+                          'score': state.getScore(),
+                          'pacman': state.getPacmanPosition(),
+                          'ghosts': state.getGhostPositions(),
+                          'food': state.getNumFood(),
+                          'win': state.isWin(),
+                          'lose': state.isLose()}))
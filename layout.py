@@ -13,58 +13,138 @@
 
 
 from util import manhattanDistance
-from game import Grid
+from util import nearestPoint
+from util import CACHE_DIR
+from util import writeCacheFile
+from game import BitGrid
+from game import ReadOnlyBitGrid
+from game import LegalActionTable
+from game import ZobristKeys
+from game import MazeDistances
+from game import VisibilityIndex
+import hashlib
+import marshal
 import os
+import sys
 import random
-from functools import reduce
+import re
+import zlib
 
+# Tables turning layout characters into bits, and the other characters
+# processLayoutChar handles
+WALL_BITS = bytes(ord('1') if i == ord('%') else ord('0') for i in range(256))
+FOOD_BITS = bytes(ord('1') if i == ord('.') else ord('0') for i in range(256))
+AGENT_OR_CAPSULE = re.compile('[oPG1234]')
+
+# VisibilityIndex of every board seen in this process, by content hash
 VISIBILITY_MATRIX_CACHE = {}
 
 
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    A Layout does not change once built: walls and food are read-only
+    grids, and the capsules, agent positions and text are tuples.  Game
+    states and their copies, and every game on the board, share one
+    Layout, along with the tables it builds lazily.
     """
 
     def __init__(self, layoutText):
         self.width = len(layoutText[0])
         self.height = len(layoutText)
-        self.walls = Grid(self.width, self.height, False)
-        self.food = Grid(self.width, self.height, False)
+        self.walls = BitGrid(self.width, self.height, False)
+        self.food = BitGrid(self.width, self.height, False)
         self.capsules = []
         self.agentPositions = []
         self.numGhosts = 0
         self.processLayoutText(layoutText)
-        self.layoutText = layoutText
-        self.totalFood = len(self.food.asList())
-        # self.initializeVisibilityMatrix()
+        self.walls = ReadOnlyBitGrid.fromBitGrid(self.walls)
+        self.food = ReadOnlyBitGrid.fromBitGrid(self.food)
+        self.capsules = tuple(self.capsules)
+        self.agentPositions = tuple(self.agentPositions)
+        self.layoutText = tuple(layoutText)
+        self.totalFood = self.food.count()
+        self.legalActionTable = None
+        self.zobristKeys = None
+        self.mazeDistances = None
+        self.visibility = None
 
     def getNumGhosts(self):
         return self.numGhosts
 
+    def getLegalActionTable(self):
+        """
+        Returns the LegalActionTable for this board, building it on first use.
+        Copies of the layout share the same table.
+        """
+        if self.legalActionTable == None:
+            self.legalActionTable = LegalActionTable(self.walls)
+        return self.legalActionTable
+
+    def getZobristKeys(self):
+        """
+        Returns the ZobristKeys for this board, building them on first use.
+        Copies of the layout share the same keys.
+        """
+        if self.zobristKeys == None:
+            seed = zlib.crc32('\n'.join(self.layoutText).encode())
+            self.zobristKeys = ZobristKeys(self.height, seed)
+        return self.zobristKeys
+
+    def getContentHash(self):
+        """
+        Returns a hex digest of the layout text, naming this board in caches.
+        """
+        return hashlib.sha1('\n'.join(self.layoutText).encode()).hexdigest()
+
+    def getMazeDistances(self):
+        """
+        Returns the MazeDistances for this board.  The table is read from the
+        on-disk cache when possible, and otherwise computed and written there
+        for the next run.  Copies of the layout share the same table.
+        """
+        if self.mazeDistances == None:
+            fname = os.path.join(CACHE_DIR, 'distances-%s-%s.bin' % (
+                self.getContentHash(), sys.byteorder))
+            try:
+                f = open(fname, 'rb')
+                try:
+                    self.mazeDistances = MazeDistances.fromBytes(
+                        self.walls, f.read())
+                finally:
+                    f.close()
+            except Exception:
+                self.mazeDistances = MazeDistances(self.walls)
+                writeCacheFile(fname, self.mazeDistances.toBytes())
+        return self.mazeDistances
+
+    def getVisibility(self):
+        """
+        Returns the VisibilityIndex for this board, shared by every layout
+        with the same text.  It is read from the on-disk cache when
+        possible, and otherwise computed and written there.
+        """
+        if self.visibility == None:
+            contentHash = self.getContentHash()
+            if contentHash not in VISIBILITY_MATRIX_CACHE:
+                fname = os.path.join(CACHE_DIR, 'visibility-%s-%s.bin' % (
+                    contentHash, sys.byteorder))
+                try:
+                    f = open(fname, 'rb')
+                    try:
+                        visibility = VisibilityIndex.fromBytes(self.walls, f.read())
+                    finally:
+                        f.close()
+                except Exception:
+                    visibility = VisibilityIndex(self.walls)
+                    writeCacheFile(fname, visibility.toBytes())
+                VISIBILITY_MATRIX_CACHE[contentHash] = visibility
+            self.visibility = VISIBILITY_MATRIX_CACHE[contentHash]
+        return self.visibility
+
     def initializeVisibilityMatrix(self):
-        global VISIBILITY_MATRIX_CACHE
-        if reduce(str.__add__, self.layoutText) not in VISIBILITY_MATRIX_CACHE:
-            from game import Directions
-            vecs = [(-0.5, 0), (0.5, 0), (0, -0.5), (0, 0.5)]
-            dirs = [Directions.NORTH, Directions.SOUTH,
-                    Directions.WEST, Directions.EAST]
-            vis = Grid(self.width, self.height, {Directions.NORTH: set(), Directions.SOUTH: set(
-            ), Directions.EAST: set(), Directions.WEST: set(), Directions.STOP: set()})
-            for x in range(self.width):
-                for y in range(self.height):
-                    if self.walls[x][y] == False:
-                        for vec, direction in zip(vecs, dirs):
-                            dx, dy = vec
-                            nextx, nexty = x + dx, y + dy
-                            while (nextx + nexty) != int(nextx) + int(nexty) or not self.walls[int(nextx)][int(nexty)]:
-                                vis[x][y][direction].add((nextx, nexty))
-                                nextx, nexty = x + dx, y + dy
-            self.visibility = vis
-            VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)] = vis
-        else:
-            self.visibility = VISIBILITY_MATRIX_CACHE[reduce(
-                str.__add__, self.layoutText)]
+        self.getVisibility()
 
     def isWall(self, pos):
         x, col = pos
@@ -90,14 +170,57 @@ class Layout:
         return pos
 
     def isVisibleFrom(self, ghostPos, pacPos, pacDirection):
-        row, col = [int(x) for x in pacPos]
-        return ghostPos in self.visibility[row][col][pacDirection]
+        """
+        Returns whether Pacman at pacPos, facing pacDirection, can see a
+        ghost at ghostPos.  A ghost between two cells is seen if either of
+        them is.
+        """
+        visibility = self.getVisibility()
+        x, y = ghostPos
+        cells = set([(int(x), int(y)), nearestPoint((x, y))])
+        for cell in cells:
+            if visibility.isVisible(pacPos, cell, pacDirection):
+                return True
+        return False
 
     def __str__(self):
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        # Layouts are immutable, so a copy can be the layout itself
+        return self
+
+    def compile(self):
+        """
+        Returns the parsed board as plain values that marshal can store:
+        the compiled form, which Layout.fromCompiled loads without parsing
+        the text again.
+        """
+        return (self.layoutText, self.width, self.height, self.walls.bits,
+                self.food.bits, self.capsules, self.agentPositions, self.numGhosts)
+
+    def fromCompiled(compiled):
+        (layoutText, width, height, wallBits, foodBits,
+         capsules, agentPositions, numGhosts) = compiled
+        layout = Layout.__new__(Layout)
+        layout.width = width
+        layout.height = height
+        layout.walls = ReadOnlyBitGrid(width, height, False)
+        layout.walls.bits = wallBits
+        layout.food = ReadOnlyBitGrid(width, height, False)
+        layout.food.bits = foodBits
+        layout.capsules = tuple(tuple(pos) for pos in capsules)
+        layout.agentPositions = tuple((isPacman, tuple(pos))
+                                      for isPacman, pos in agentPositions)
+        layout.numGhosts = numGhosts
+        layout.layoutText = tuple(layoutText)
+        layout.totalFood = layout.food.count()
+        layout.legalActionTable = None
+        layout.zobristKeys = None
+        layout.mazeDistances = None
+        layout.visibility = None
+        return layout
+    fromCompiled = staticmethod(fromCompiled)
 
     def processLayoutText(self, layoutText):
         """
@@ -113,10 +236,20 @@ class Layout:
         Other characters are ignored.
         """
         maxY = self.height - 1
+        rows = [layoutText[maxY - y][:self.width] for y in range(self.height)]
+        for row in rows:
+            if len(row) < self.width:
+                raise Exception('Layout line shorter than the first: %r' % row)
+        # Walls and food are set a whole grid at a time, as strings of the
+        # cells in BitGrid bit order, which stays fast on large boards.
+        cells = ''.join([''.join(column) for column in zip(*rows)])
+        cells = cells[::-1].encode('ascii', 'replace')
+        if cells:
+            self.walls.bits = int(cells.translate(WALL_BITS), 2)
+            self.food.bits = int(cells.translate(FOOD_BITS), 2)
         for y in range(self.height):
-            for x in range(self.width):
-                layoutChar = layoutText[maxY - y][x]
-                self.processLayoutChar(x, y, layoutChar)
+            for match in AGENT_OR_CAPSULE.finditer(rows[y]):
+                self.processLayoutChar(match.start(), y, match.group())
         self.agentPositions.sort()
         self.agentPositions = [(i == 0, pos) for i, pos in self.agentPositions]
 
@@ -137,28 +270,121 @@ class Layout:
             self.numGhosts += 1
 
 
-def getLayout(name, back=2):
-    if name.endswith('.lay'):
-        layout = tryToLoad('layouts/' + name)
-        if layout == None:
-            layout = tryToLoad(name)
-    else:
-        layout = tryToLoad('layouts/' + name + '.lay')
+def findLayoutByHash(contentHash):
+    """
+    Returns the layout in the layouts directory whose text has the given
+    content hash (see Layout.getContentHash), or None.
+    """
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layouts')
+    for fname in sorted(os.listdir(directory)):
+        if fname.endswith('.lay'):
+            layout = tryToLoad(os.path.join(directory, fname))
+            if layout != None and layout.getContentHash() == contentHash:
+                return layout
+    return None
+
+
+class LayoutRegistry:
+    """
+    Finds layouts by name and keeps them in memory once parsed, so loading
+    a layout again costs a stat() call.  Names are resolved to absolute
+    paths without changing the working directory, which makes the registry
+    safe to use from threads.
+
+    With useCompiled, every layout read from its text is also stored in
+    compiled form (see Layout.compile) in CACHE_DIR, and later runs load
+    that instead of parsing the text while the file is unchanged.
+    """
+
+    def __init__(self, useCompiled=True):
+        self.useCompiled = useCompiled
+        self.paths = {}
+        self.layouts = {}
+
+    def resolve(self, name, back=2):
+        """
+        Returns the path of the layout called name, looked up in layouts/
+        and then as a file name, in the working directory and then in up to
+        back + 1 directories above it; None if there is no such layout.
+        """
+        key = (os.getcwd(), name, back)
+        if key in self.paths:
+            return self.paths[key]
+        if name.endswith('.lay'):
+            candidates = [os.path.join('layouts', name), name]
+        else:
+            candidates = [os.path.join('layouts', name + '.lay'), name + '.lay']
+        directory = key[0]
+        for level in range(back + 2):
+            for candidate in candidates:
+                path = os.path.join(directory, candidate)
+                if os.path.exists(path):
+                    self.paths[key] = path
+                    return path
+            directory = os.path.dirname(directory)
+        return None
+
+    def getCompiledName(self, path):
+        key = hashlib.sha1(path.encode()).hexdigest()
+        return os.path.join(CACHE_DIR, 'layout-%s-%d.bin' % (key, marshal.version))
+
+    def load(self, path):
+        """
+        Returns the Layout in the file at path, from memory if it has not
+        changed since it was last loaded.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        if path in self.layouts and self.layouts[path][0] == version:
+            return self.layouts[path][1]
+        layout = None
+        if self.useCompiled:
+            try:
+                f = open(self.getCompiledName(path), 'rb')
+                try:
+                    compiledVersion, compiled = marshal.loads(f.read())
+                finally:
+                    f.close()
+                if tuple(compiledVersion) == version:
+                    layout = Layout.fromCompiled(compiled)
+            except Exception:
+                pass
         if layout == None:
-            layout = tryToLoad(name + '.lay')
-    if layout == None and back >= 0:
-        curdir = os.path.abspath('.')
-        os.chdir('..')
-        layout = getLayout(name, back - 1)
-        os.chdir(curdir)
-    return layout
+            f = open(path)
+            try:
+                layout = Layout([line.strip() for line in f])
+            finally:
+                f.close()
+            if self.useCompiled:
+                writeCacheFile(self.getCompiledName(path),
+                               marshal.dumps((version, layout.compile())))
+        self.layouts[path] = (version, layout)
+        return layout
+
+    def getLayout(self, name, back=2):
+        import mazeGenerator
+        maze = mazeGenerator.parseMazeName(name)
+        if maze != None:
+            # Generated mazes depend only on their name
+            if name not in self.layouts:
+                width, height, keywords = maze
+                self.layouts[name] = (None, mazeGenerator.generateMaze(width, height, **keywords))
+            return self.layouts[name][1]
+        path = self.resolve(name, back)
+        if path == None:
+            return None
+        return self.load(path)
+
+
+REGISTRY = LayoutRegistry()
+
+
+def getLayout(name, back=2):
+    return REGISTRY.getLayout(name, back)
 
 
 def tryToLoad(fullname):
     if(not os.path.exists(fullname)):
         return None
-    f = open(fullname)
-    try:
-        return Layout([line.strip() for line in f])
-    finally:
-        f.close()
+    return REGISTRY.load(fullname)
@@ -0,0 +1,211 @@
+# mazeGenerator.py
+# ----------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+"""
+Procedural Pacman mazes of any size, for scaling benchmarks.
+
+The same parameters and seed always give the same maze.  Corridors are
+carved by a randomized depth-first search over the cells with odd
+coordinates, which gives a tree of corridors one cell wide; knocking down
+some of the walls left between corridors then adds the loops Pacman needs
+to get away from ghosts.
+
+Layouts can be made directly, or by name anywhere a layout name is
+accepted (pacman.py -l, benchmark.py --layouts, layout.getLayout):
+
+  maze:200x200
+  maze:1000x1000:seed=3,ghosts=200,loops=0.2
+
+Run this module to write a maze to a .lay file:
+
+  python mazeGenerator.py --width 200 --height 200 --ghosts 50 -o big.lay
+"""
+
+import random
+import sys
+
+PREFIX = 'maze:'
+
+# Parameter names accepted in layout names, with the keyword each sets
+PARAMETERS = {'seed': 'seed',
+              'density': 'corridorDensity',
+              'loops': 'loopRatio',
+              'food': 'foodDensity',
+              'capsules': 'numCapsules',
+              'ghosts': 'numGhosts'}
+
+
+def generateMazeText(width, height, seed=0, corridorDensity=1.0, loopRatio=0.1,
+                     foodDensity=1.0, numCapsules=4, numGhosts=4):
+    """
+    Returns the lines of a maze in the .lay format.
+
+      width, height    size of the board, outer walls included (at least 5)
+      corridorDensity  fraction of the corridor junctions that are carved;
+                       lower values leave parts of the board solid wall
+      loopRatio        fraction of the walls between two corridors that are
+                       removed to make loops (0 makes a tree)
+      foodDensity      fraction of the open cells holding food
+      numCapsules      number of capsules
+      numGhosts        number of ghosts
+
+    Pacman, the ghosts and the capsules are placed on distinct open cells.
+    """
+    if width < 5 or height < 5:
+        raise Exception('Mazes are at least 5x5, not %dx%d' % (width, height))
+    if not 0 < corridorDensity <= 1 or not 0 <= loopRatio <= 1 or not 0 <= foodDensity <= 1:
+        raise Exception('Densities and ratios must be between 0 and 1')
+    rng = random.Random(seed)
+    # Cells are indexed row * width + col, rows counted from the top.
+    isOpen = bytearray(width * height)
+
+    # Junctions are the cells with odd coordinates; corridors join them.
+    cols = list(range(1, width - 1, 2))
+    rows = list(range(1, height - 1, 2))
+    numJunctions = len(cols) * len(rows)
+    target = max(1, int(round(corridorDensity * numJunctions)))
+    start = rng.choice(rows) * width + rng.choice(cols)
+    isOpen[start] = 1
+    carved = 1
+    stack = [start]
+    steps = (-2 * width, 2 * width, -2, 2)
+    while stack and carved < target:
+        cell = stack[-1]
+        choices = []
+        for step in steps:
+            next = cell + step
+            nextRow, nextCol = divmod(next, width)
+            if 0 < nextRow < height - 1 and 0 < nextCol < width - 1 and not isOpen[next]:
+                choices.append(next)
+        if not choices:
+            stack.pop()
+            continue
+        next = rng.choice(choices)
+        isOpen[(cell + next) // 2] = 1
+        isOpen[next] = 1
+        carved += 1
+        stack.append(next)
+
+    # Loops: walls standing between two carved junctions
+    walls = []
+    for row in rows:
+        for col in cols:
+            cell = row * width + col
+            if not isOpen[cell]:
+                continue
+            if col + 2 < width - 1 and isOpen[cell + 2] and not isOpen[cell + 1]:
+                walls.append(cell + 1)
+            if row + 2 < height - 1 and isOpen[cell + 2 * width] and not isOpen[cell + width]:
+                walls.append(cell + width)
+    rng.shuffle(walls)
+    for cell in walls[:int(round(loopRatio * len(walls)))]:
+        isOpen[cell] = 1
+
+    cells = [i for i in range(width * height) if isOpen[i]]
+    if numGhosts + numCapsules + 1 > len(cells):
+        raise Exception('A %dx%d maze has only %d open cells' %
+                        (width, height, len(cells)))
+    special = rng.sample(cells, numGhosts + numCapsules + 1)
+    chars = bytearray(b'%') * (width * height)
+    for i in cells:
+        chars[i] = ord(' ')
+    for i in rng.sample(cells, int(round(foodDensity * len(cells)))):
+        chars[i] = ord('.')
+    chars[special[0]] = ord('P')
+    for i in special[1:numGhosts + 1]:
+        chars[i] = ord('G')
+    for i in special[numGhosts + 1:]:
+        chars[i] = ord('o')
+    text = chars.decode()
+    return [text[row * width:(row + 1) * width] for row in range(height)]
+
+
+def generateMaze(width, height, **args):
+    """
+    Returns a Layout of a maze; the keywords are those of generateMazeText.
+    """
+    import layout
+    return layout.Layout(generateMazeText(width, height, **args))
+
+
+def parseMazeName(name):
+    """
+    Returns (width, height, keywords) for a name like
+    maze:200x100:seed=2,ghosts=10, or None if name is not a maze name.
+    """
+    if not name.startswith(PREFIX):
+        return None
+    parts = name[len(PREFIX):].split(':', 1)
+    try:
+        width, height = [int(n) for n in parts[0].lower().split('x')]
+    except ValueError:
+        raise Exception('Bad maze size in %s; use maze:WIDTHxHEIGHT' % name)
+    keywords = {}
+    if len(parts) > 1 and parts[1]:
+        for pair in parts[1].split(','):
+            key, value = pair.split('=')
+            if key not in PARAMETERS:
+                raise Exception('Unknown maze parameter %s; use one of %s' %
+                                (key, ', '.join(sorted(PARAMETERS))))
+            if key in ('density', 'loops', 'food'):
+                keywords[PARAMETERS[key]] = float(value)
+            else:
+                keywords[PARAMETERS[key]] = int(value)
+    return width, height, keywords
+
+
+def writeLayoutFile(fname, lines):
+    f = open(fname, 'w')
+    try:
+        f.write('\n'.join(lines) + '\n')
+    finally:
+        f.close()
+
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser(__doc__)
+    parser.add_option('--width', dest='width', type='int', default=100,
+                      help='Board width, walls included [Default: %default]')
+    parser.add_option('--height', dest='height', type='int', default=100,
+                      help='Board height, walls included [Default: %default]')
+    parser.add_option('-s', '--seed', dest='seed', type='int', default=0,
+                      help='Random seed [Default: %default]')
+    parser.add_option('--density', dest='density', type='float', default=1.0,
+                      help='Fraction of corridor junctions carved [Default: %default]')
+    parser.add_option('--loops', dest='loops', type='float', default=0.1,
+                      help='Fraction of inner walls removed to make loops [Default: %default]')
+    parser.add_option('--food', dest='food', type='float', default=1.0,
+                      help='Fraction of open cells with food [Default: %default]')
+    parser.add_option('--capsules', dest='capsules', type='int', default=4,
+                      help='Number of capsules [Default: %default]')
+    parser.add_option('--ghosts', dest='ghosts', type='int', default=4,
+                      help='Number of ghosts [Default: %default]')
+    parser.add_option('-o', '--output', dest='output', default=None,
+                      help='The .lay file to write [Default: standard output]')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+
+if __name__ == '__main__':
+    options = readCommand(sys.argv[1:])
+    lines = generateMazeText(options.width, options.height, seed=options.seed,
+                             corridorDensity=options.density, loopRatio=options.loops,
+                             foodDensity=options.food, numCapsules=options.capsules,
+                             numGhosts=options.ghosts)
+    if options.output:
+        writeLayoutFile(options.output, lines)
+    else:
+        print('\n'.join(lines))
@@ -21,6 +21,7 @@
 #           used by multiAgents.scoreEvaluationFunction, which is the default
 #
 import testClasses
+import testParser
 import json
 
 from collections import defaultdict
@@ -115,6 +116,10 @@ class MultiagentTreeProblem(object):
 
 
 def parseTreeProblem(testDict):
+    return MultiagentTreeProblem(*testParser.getDerived(testDict, 'treeProblem', parseTreeProblemParts))
+
+
+def parseTreeProblemParts(testDict):
     numAgents = int(testDict["num_agents"])
     startState = testDict["start_state"]
     winStates = set(testDict["win_states"].split(" "))
@@ -138,7 +143,7 @@ def parseTreeProblem(testDict):
         else:
             raise Exception("[parseTree] Bad successor line: |%s|" % (line,))
 
-    return MultiagentTreeProblem(numAgents, startState, winStates, loseStates, successors, evaluation)
+    return (numAgents, startState, winStates, loseStates, successors, evaluation)
 
 
 def run(lay, layName, pac, ghosts, disp, nGames=1, name='games'):
@@ -43,6 +43,8 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
+from game import GameStats
 from util import nearestPoint
 from util import manhattanDistance
 import util
@@ -80,6 +82,9 @@ class GameState:
     # static variable keeps track of which states have had getLegalActions called
     explored = set()
 
+    # static variable counting every successor generated, for GameStats
+    numSuccessors = 0
+
     def getAndResetExplored():
         tmp = GameState.explored.copy()
         GameState.explored = set()
@@ -99,9 +104,11 @@ class GameState:
         else:
             return GhostRules.getLegalActions(self, agentIndex)
 
-    def generateSuccessor(self, agentIndex, action):
+    def generateSuccessor(self, agentIndex, action, explore=True):
         """
         Returns the successor state after the specified agent takes the action.
+        With explore=False the states are not added to GameState.explored,
+        for callers such as replays that are not searching.
         """
         # Check that successors exist
         if self.isWin() or self.isLose():
@@ -112,7 +119,7 @@ class GameState:
 
         # Let agent's logic deal with its action's effects on the board
         if agentIndex == 0:  # Pacman is moving
-            state.data._eaten = [False for i in range(state.getNumAgents())]
+            state.data._eaten = [False] * state.getNumAgents()
             PacmanRules.applyAction(state, action)
         else:                # A ghost is moving
             GhostRules.applyAction(state, action, agentIndex)
@@ -121,16 +128,19 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY  # Penalty for waiting around
         else:
-            GhostRules.decrementTimer(state.data.agentStates[agentIndex])
+            GhostRules.decrementTimer(
+                state.data.getWritableAgentState(agentIndex))
 
         # Resolve multi-agent effects
         GhostRules.checkDeath(state, agentIndex)
 
         # Book keeping
+        GameState.numSuccessors += 1
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        if explore:
+            GameState.explored.add(self)
+            GameState.explored.add(state)
         return state
 
     def getLegalPacmanActions(self):
@@ -157,6 +167,17 @@ class GameState:
     def getGhostStates(self):
         return self.data.agentStates[1:]
 
+    def getVisibleGhosts(self):
+        """
+        Returns the states of the ghosts Pacman can see, looking the way it
+        faces, up to the first wall (see Layout.isVisibleFrom).
+        """
+        pacman = self.data.agentStates[0].configuration
+        layout = self.data.layout
+        return [ghost for ghost in self.data.agentStates[1:]
+                if layout.isVisibleFrom(ghost.getPosition(), pacman.getPosition(),
+                                        pacman.getDirection())]
+
     def getGhostState(self, agentIndex):
         if agentIndex == 0 or agentIndex >= self.getNumAgents():
             raise Exception("Invalid index passed to getGhostState")
@@ -176,14 +197,23 @@ class GameState:
     def getScore(self):
         return float(self.data.score)
 
+    def getMazeDistance(self, pos1, pos2):
+        """
+        Returns the length of the shortest path between two positions, going
+        around walls.  Looked up in a table precomputed for the layout.
+        """
+        return self.data.layout.getMazeDistances().getDistance(pos1, pos2)
+
     def getCapsules(self):
         """
         Returns a list of positions (x,y) of the remaining capsules.
+
+        Successors share one capsule list, so the caller gets a copy.
         """
-        return self.data.capsules
+        return list(self.data.capsules)
 
     def getNumFood(self):
-        return self.data.food.count()
+        return self.data._numFood
 
     def getFood(self):
         """
@@ -289,6 +319,13 @@ class ClassicGameRules:
         initState.initialize(layout, len(ghostAgents))
         game = Game(agents, display, self, catchExceptions=catchExceptions)
         game.state = initState
+        # Let time-aware agents (e.g. iterative deepening) plan their moves
+        for index, agent in enumerate(agents):
+            if agent and 'setMoveTimeout' in dir(agent):
+                agent.setMoveTimeout(self.getMoveTimeout(index))
+        # Let model-based agents (e.g. expectimax) know the ghosts they face
+        if pacmanAgent and 'setGhostAgents' in dir(pacmanAgent):
+            pacmanAgent.setGhostAgents(agents[1:])
         self.initialState = initState.deepCopy()
         self.quiet = quiet
         return game
@@ -348,18 +385,26 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions(state.getPacmanState().configuration, state.data.layout.walls)
+        return list(PacmanRules._legalActions(state))
     getLegalActions = staticmethod(getLegalActions)
 
+    def _legalActions(state):
+        """
+        Returns the shared tuple of legal actions from the layout's table.
+        """
+        return state.data.layout.getLegalActionTable().getPacmanActions(
+            state.data.agentStates[0].configuration)
+    _legalActions = staticmethod(_legalActions)
+
     def applyAction(state, action):
         """
         Edits the state to reflect the results of the action.
         """
-        legal = PacmanRules.getLegalActions(state)
+        legal = PacmanRules._legalActions(state)
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.getWritableAgentState(0)
 
         # Update Configuration
         vector = Actions.directionToVector(action, PacmanRules.PACMAN_SPEED)
@@ -379,21 +424,19 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.removeFood(position)
             state.data._foodEaten = position
-            # TODO: cache numFood?
-            numFood = state.getNumFood()
-            if numFood == 0 and not state.data._lose:
+            if state.data._numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if(position in state.getCapsules()):
-            state.data.capsules.remove(position)
+            state.data.removeCapsule(position)
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range(1, len(state.data.agentStates)):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.getWritableAgentState(
+                    index).scaredTimer = SCARED_TIME
     consume = staticmethod(consume)
 
 
@@ -408,24 +451,24 @@ class GhostRules:
         Ghosts cannot stop, and cannot turn around unless they
         reach a dead end, but can turn 90 degrees at intersections.
         """
-        conf = state.getGhostState(ghostIndex).configuration
-        possibleActions = Actions.getPossibleActions(
-            conf, state.data.layout.walls)
-        reverse = Actions.reverseDirection(conf.direction)
-        if Directions.STOP in possibleActions:
-            possibleActions.remove(Directions.STOP)
-        if reverse in possibleActions and len(possibleActions) > 1:
-            possibleActions.remove(reverse)
-        return possibleActions
+        return list(GhostRules._legalActions(state, ghostIndex))
     getLegalActions = staticmethod(getLegalActions)
 
+    def _legalActions(state, ghostIndex):
+        """
+        Returns the shared tuple of legal actions from the layout's table.
+        """
+        conf = state.getGhostState(ghostIndex).configuration
+        return state.data.layout.getLegalActionTable().getGhostActions(conf)
+    _legalActions = staticmethod(_legalActions)
+
     def applyAction(state, action, ghostIndex):
 
-        legal = GhostRules.getLegalActions(state, ghostIndex)
+        legal = GhostRules._legalActions(state, ghostIndex)
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.getWritableAgentState(ghostIndex)
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0:
             speed /= 2.0
@@ -437,8 +480,8 @@ class GhostRules:
     def decrementTimer(ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint(
-                ghostState.configuration.pos)
+            ghostState.configuration = Configuration(nearestPoint(
+                ghostState.configuration.pos), ghostState.configuration.direction)
         ghostState.scaredTimer = max(0, timer - 1)
     decrementTimer = staticmethod(decrementTimer)
 
@@ -460,9 +503,11 @@ class GhostRules:
     def collide(state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
+            ghostState = state.data.getWritableAgentState(agentIndex)
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
             # Added for first-person
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -478,6 +523,125 @@ class GhostRules:
         ghostState.configuration = ghostState.start
     placeGhost = staticmethod(placeGhost)
 
+class RolloutState:
+    """
+    A lightweight, mutable stand-in for a GameState, for playouts.
+
+    It follows the same classic rules as GameState.generateSuccessor, but
+    steps in place: there is no copying, no legality check (callers must
+    pick from pacmanActions/ghostActions) and no explored bookkeeping.
+    Food is kept as the BitGrid bit mask and agents as plain lists.
+    """
+
+    def __init__(self, gameState=None):
+        if gameState is None:
+            return
+        data = gameState.data
+        self.table = data.layout.getLegalActionTable()
+        self.height = self.table.height
+        self.foodBits = data.food.bits
+        self.numFood = data._numFood
+        self.capsules = list(data.capsules)
+        self.score = data.score
+        self.win = data._win
+        self.lose = data._lose
+        self.pacman = data.agentStates[0].configuration.pos
+        ghosts = data.agentStates[1:]
+        self.ghostPos = [g.configuration.pos for g in ghosts]
+        self.ghostDir = [g.configuration.direction for g in ghosts]
+        self.ghostStart = [(g.start.pos, g.start.direction) for g in ghosts]
+        self.scared = [g.scaredTimer for g in ghosts]
+
+    def copy(self):
+        state = RolloutState()
+        state.table = self.table
+        state.height = self.height
+        state.foodBits = self.foodBits
+        state.numFood = self.numFood
+        state.capsules = self.capsules[:]
+        state.score = self.score
+        state.win = self.win
+        state.lose = self.lose
+        state.pacman = self.pacman
+        state.ghostPos = self.ghostPos[:]
+        state.ghostDir = self.ghostDir[:]
+        state.ghostStart = self.ghostStart
+        state.scared = self.scared[:]
+        return state
+
+    def isTerminal(self):
+        return self.win or self.lose
+
+    def getNumAgents(self):
+        return len(self.ghostPos) + 1
+
+    def pacmanActions(self):
+        x, y = self.pacman
+        return self.table.pacmanActions[int(x) * self.height + int(y)]
+
+    def ghostActions(self, ghost):
+        x, y = self.ghostPos[ghost]
+        x_int, y_int = int(x + 0.5), int(y + 0.5)
+        if abs(x - x_int) + abs(y - y_int) > Actions.TOLERANCE:
+            if self.ghostDir[ghost] == Directions.STOP:
+                return ()
+            return (self.ghostDir[ghost],)
+        return self.table.ghostActions[x_int * self.height + y_int][self.ghostDir[ghost]]
+
+    def hasFood(self, position):
+        x, y = position
+        return (self.foodBits >> (int(x) * self.height + int(y))) & 1
+
+    def stepPacman(self, action):
+        dx, dy = Actions._directions[action]
+        x, y = self.pacman
+        self.pacman = position = (x + dx, y + dy)
+        bit = 1 << (int(position[0]) * self.height + int(position[1]))
+        if self.foodBits & bit:
+            self.score += 10
+            self.foodBits ^= bit
+            self.numFood -= 1
+            if self.numFood == 0 and not self.lose:
+                self.score += 500
+                self.win = True
+        if position in self.capsules:
+            self.capsules.remove(position)
+            for ghost in range(len(self.scared)):
+                self.scared[ghost] = SCARED_TIME
+        self.score -= TIME_PENALTY
+        for ghost in range(len(self.ghostPos)):
+            self._checkDeath(ghost)
+
+    def stepGhost(self, ghost, action):
+        """
+        Moves ghost number ghost (agent index ghost + 1).
+        """
+        dx, dy = Actions._directions[action]
+        timer = self.scared[ghost]
+        if timer > 0:
+            dx, dy = dx * GhostRules.GHOST_SPEED / 2.0, dy * GhostRules.GHOST_SPEED / 2.0
+        else:
+            dx, dy = dx * GhostRules.GHOST_SPEED, dy * GhostRules.GHOST_SPEED
+        x, y = self.ghostPos[ghost]
+        self.ghostPos[ghost] = (x + dx, y + dy)
+        if action != Directions.STOP:
+            self.ghostDir[ghost] = action
+        if timer == 1:
+            self.ghostPos[ghost] = nearestPoint(self.ghostPos[ghost])
+        self.scared[ghost] = max(0, timer - 1)
+        self._checkDeath(ghost)
+
+    def _checkDeath(self, ghost):
+        if manhattanDistance(self.ghostPos[ghost], self.pacman) <= COLLISION_TOLERANCE:
+            if self.scared[ghost] > 0:
+                self.score += 200
+                self.ghostPos[ghost], self.ghostDir[ghost] = self.ghostStart[ghost]
+                self.scared[ghost] = 0
+            elif not self.win:
+                self.score -= 500
+                self.lose = True
+
+
 #############################
 # FRAMEWORK TO START A GAME #
 #############################
@@ -543,7 +707,9 @@ def readCommand(argv):
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
                       help='Writes game histories to a file (named by the time they were played)', default=False)
     parser.add_option('--replay', dest='gameToReplay',
-                      help='A recorded game file (pickle) to replay', default=None)
+                      help='A recorded game file to replay', default=None)
+    parser.add_option('--replayFrom', dest='replayStart', type='int',
+                      help=default('The move a replay starts from'), default=0)
     parser.add_option('-a', '--agentArgs', dest='agentArgs',
                       help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
@@ -554,6 +720,20 @@ def readCommand(argv):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--workers', dest='workers', type='int',
+                      help=default('Number of processes to play games in parallel (0 plays them in this process)'), default=0)
+    parser.add_option('--stats', action='store_true', dest='stats',
+                      help='Measures each agent (latency, successors, evaluations) and prints a table', default=False)
+    parser.add_option('--traceMemory', action='store_true', dest='traceMemory',
+                      help='With --stats, also measures peak memory per move (slow)', default=False)
+    parser.add_option('--fast', action='store_true', dest='fast',
+                      help='Skips state copies, timeouts and the display for bulk runs of trusted agents', default=False)
+    parser.add_option('--gif', dest='gifFile',
+                      help='Draws the games offscreen into this animated GIF (needs NumPy)', default=None)
+    parser.add_option('--frameDir', dest='frameDir',
+                      help='Draws the games offscreen as numbered PNG files in this directory (needs NumPy)', default=None)
+    parser.add_option('--frameStep', dest='frameStep', type='int',
+                      help=default('With --gif or --frameDir, draws every N-th move'), default=1)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -570,10 +750,19 @@ def readCommand(argv):
         raise Exception("The layout " + options.layout + " cannot be found")
 
     # Choose a Pacman agent
+    rasterGraphics = options.gifFile != None or options.frameDir != None
     noKeyboard = options.gameToReplay == None and (
-        options.textGraphics or options.quietGraphics)
+        options.textGraphics or options.quietGraphics or rasterGraphics)
     pacmanType = loadAgent(options.pacman, noKeyboard)
     agentOpts = parseAgentArgs(options.agentArgs)
+    if options.workers > 0 and options.numTraining > 0:
+        raise Exception('Training games must be played in order; '
+                        '--workers cannot be combined with --numTraining')
+    if options.fast and options.catchExceptions:
+        raise Exception('--fast does not enforce timeouts or catch exceptions; '
+                        'it cannot be combined with --catchExceptions')
+    if options.fast and rasterGraphics:
+        raise Exception('--fast skips the display; it cannot be combined with --gif or --frameDir')
     if options.numTraining > 0:
         args['numTraining'] = options.numTraining
         if 'numTraining' not in agentOpts:
@@ -591,7 +780,12 @@ def readCommand(argv):
     args['ghosts'] = [ghostType(i+1) for i in range(options.numGhosts)]
 
     # Choose a display format
-    if options.quietGraphics:
+    if rasterGraphics:
+        import rasterDisplay
+        args['display'] = rasterDisplay.RasterGraphics(
+            rasterDisplay.DEFAULT_CELL_SIZE * options.zoom, frameDir=options.frameDir,
+            gifFile=options.gifFile, frameStep=options.frameStep)
+    elif options.quietGraphics:
         import textDisplay
         args['display'] = textDisplay.NullGraphics()
     elif options.textGraphics:
@@ -606,17 +800,36 @@ def readCommand(argv):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['workers'] = options.workers
+    args['fast'] = options.fast
+    args['stats'] = options.stats or options.traceMemory
+    args['traceMemory'] = options.traceMemory
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
         print('Replaying recorded game %s.' % options.gameToReplay)
-        import pickle
-        f = open(options.gameToReplay)
-        try:
-            recorded = pickle.load(f)
-        finally:
-            f.close()
+        import gameRecords
+        if gameRecords.isRecording(options.gameToReplay):
+            record = gameRecords.readRecording(options.gameToReplay)
+            contentHash = record.header['layoutHash']
+            recordedLayout = args['layout']
+            if recordedLayout.getContentHash() != contentHash:
+                recordedLayout = layout.findLayoutByHash(contentHash)
+            if recordedLayout == None:
+                raise Exception('The layout of %s cannot be found; pass it with --layout'
+                                % options.gameToReplay)
+            recorded = {'layout': recordedLayout, 'actions': record.actions,
+                        'keyframes': record.keyframes}
+        else:
+            # Recordings from older versions are pickles
+            import pickle
+            f = open(options.gameToReplay, 'rb')
+            try:
+                recorded = pickle.load(f)
+            finally:
+                f.close()
         recorded['display'] = args['display']
+        recorded['start'] = options.replayStart
         replayGame(**recorded)
         sys.exit(0)
 
@@ -651,17 +864,27 @@ def loadAgent(pacman, nographics):
                     ' is not specified in any *Agents.py.')
 
 
-def replayGame(layout, actions, display):
+def replayGame(layout, actions, display, start=0, keyframes=None):
+    """
+    Shows a recorded game from move start onwards.  The moves before start
+    are not displayed: the state there is rebuilt from the nearest keyframe.
+    """
     import pacmanAgents
     import ghostAgents
+    import gameRecords
     rules = ClassicGameRules()
     agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1)
                                              for i in range(layout.getNumGhosts())]
     game = rules.newGame(layout, agents[0], agents[1:], display)
     state = game.state
+    if start > 0:
+        header = {'agents': [None] * state.getNumAgents()}
+        record = gameRecords.GameRecord(header, actions, None, keyframes)
+        state = gameRecords.Replay(record, layout).getState(min(start, len(actions)))
+        game.state = state
     display.initialize(state.data)
 
-    for action in actions:
+    for action in actions[start:]:
             # Execute the action
         state = state.generateSuccessor(*action)
         # Change the display
@@ -672,10 +895,170 @@ def replayGame(layout, actions, display):
     display.finish()
 
 
-def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, catchExceptions=False, timeout=30):
+class GameResult:
+    """
+    A lightweight summary of one finished game, small enough to send back
+    from a worker process in place of the whole Game object.
+    """
+
+    def __init__(self, index, seed, game, elapsed):
+        self.index = index
+        self.seed = seed
+        self.score = game.state.getScore()
+        self.win = game.state.isWin()
+        self.moveHistory = game.moveHistory
+        self.numMoves = len(game.moveHistory)
+        self.agentTimes = game.totalAgentTimes
+        self.timeWarnings = game.totalAgentTimeWarnings
+        self.agentTimeout = game.agentTimeout
+        self.agentCrashed = game.agentCrashed
+        self.elapsed = elapsed
+        self.stats = game.stats
+
+    def __str__(self):
+        outcome = ['Loss', 'Win'][int(self.win)]
+        if self.agentCrashed:
+            outcome = 'Crash'
+        elif self.agentTimeout:
+            outcome = 'Timeout'
+        return 'Game %d: %s, score %d, %d moves, %.2fs' % (
+            self.index + 1, outcome, self.score, self.numMoves, self.elapsed)
+
+
+# Per-process game setup, filled in once by _initGameWorker
+_workerGame = None
+
+
+def _initGameWorker(layout, pacman, ghosts, catchExceptions, timeout, fast, record, stats, traceMemory):
+    global _workerGame
+    _workerGame = (layout, pacman, ghosts, catchExceptions, timeout, fast, record,
+                   stats, traceMemory)
+
+
+def _runGameInWorker(index, seed):
+    """
+    Plays game number index in a worker process.  playGame seeds the
+    global random module per game, which makes the outcome independent of
+    which worker plays it.
+    """
+    import textDisplay
+    (layout, pacman, ghosts, catchExceptions, timeout, fast, record,
+     stats, traceMemory) = _workerGame
+    rules = ClassicGameRules(timeout)
+    game = rules.newGame(layout, pacman, ghosts,
+                         textDisplay.NullGraphics(), False, catchExceptions)
+    start = time.time()
+    playGame(game, fast, record, index, seed, stats, traceMemory)
+    return GameResult(index, seed, game, time.time() - start)
+
+
+def playGame(game, fast=False, record=False, index=0, seed=None, stats=False, traceMemory=False):
+    """
+    Runs a game, streaming it to a recording file if record is set.  The
+    file is closed even if the game raises; it then has no footer.  With
+    stats, game.stats is a GameStats measuring every decision.
+
+    The random module is seeded with seed before the game starts (a seed
+    is drawn when none is given), so the game plays the same whether or
+    not it is recorded, and its recording names the seed that replays it.
+    """
+    if seed is None:
+        seed = random.getrandbits(64)
+    random.seed(seed)
+    if stats:
+        game.stats = GameStats(len(game.agents), traceMemory)
+        game.stats.attach(game.agents)
+    recorder = None
+    if record:
+        import gameRecords
+        fname = ('recorded-game-%d-' % (index + 1)) + \
+            '-'.join([str(t) for t in time.localtime()[1:6]]) + '.rec'
+        recorder = gameRecords.GameRecorder(
+            fname, game.state.data.layout, game.agents, seed)
+        game.recorder = recorder
+    try:
+        if fast:
+            game.runFast()
+        else:
+            game.run()
+    finally:
+        if recorder is not None:
+            recorder.finish(game)
+            game.recorder = None
+        if game.stats is not None:
+            game.stats.detach()
+
+
+def runGamesParallel(layout, pacman, ghosts, seeds, record, workers, catchExceptions=False, timeout=30, fast=False,
+                     stats=False, traceMemory=False):
+    """
+    Plays one game per seed across a pool of worker processes and returns
+    their GameResults in game order.  Each game seeds the random module
+    with its own seed first, as runGames does, so the games do not depend
+    on which worker plays them.  Results are printed as they come in.
+    """
+    import concurrent.futures
+    numGames = len(seeds)
+    results = [None] * numGames
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_initGameWorker,
+        initargs=(layout, pacman, ghosts, catchExceptions, timeout, fast, record,
+                  stats, traceMemory))
+    try:
+        futures = [executor.submit(_runGameInWorker, i, seeds[i])
+                   for i in range(numGames)]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results[result.index] = result
+            print(result)
+    finally:
+        executor.shutdown()
+    return results
+
+
+def printStats(games, layout, pacman, ghosts):
+    """
+    Prints the GameStats of the given games (or GameResults), merged.
+    """
+    agents = [pacman] + ghosts[:layout.getNumGhosts()]
+    total = GameStats(len(agents))
+    for game in games:
+        if game.stats is not None:
+            total.merge(game.stats)
+    print(total.formatTable([agent.__class__.__name__ for agent in agents]))
+
+
+def printSummary(scores, wins):
+    winRate = wins.count(True) / float(len(wins))
+    print('Average Score:', sum(scores) / float(len(scores)))
+    print('Scores:       ', ', '.join([str(score) for score in scores]))
+    print('Win Rate:      %d/%d (%.2f)' %
+          (wins.count(True), len(wins), winRate))
+    print('Record:       ', ', '.join(
+        [['Loss', 'Win'][int(w)] for w in wins]))
+
+
+def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, catchExceptions=False, timeout=30, workers=0, fast=False,
+             stats=False, traceMemory=False):
     import __main__
     __main__.__dict__['_display'] = display
 
+    # playGame seeds the random module with each game's seed, drawn here,
+    # so a run with --fixRandomSeed plays the same games with any number
+    # of workers, and recordings name the seed of their game
+    seeds = [random.getrandbits(64) for i in range(numGames)]
+
+    if workers > 0:
+        results = runGamesParallel(layout, pacman, ghosts, seeds, record,
+                                   workers, catchExceptions, timeout, fast,
+                                   stats, traceMemory)
+        if numGames > 0:
+            printSummary([result.score for result in results],
+                         [result.win for result in results])
+            if stats:
+                printStats(results, layout, pacman, ghosts)
+        return results
+
     rules = ClassicGameRules(timeout)
     games = []
 
@@ -691,30 +1074,15 @@ def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, c
             rules.quiet = False
         game = rules.newGame(layout, pacman, ghosts,
                              gameDisplay, beQuiet, catchExceptions)
-        game.run()
+        playGame(game, fast, record, i, seeds[i], stats and not beQuiet, traceMemory)
         if not beQuiet:
             games.append(game)
 
-        if record:
-            import time
-            import pickle
-            fname = ('recorded-game-%d' % (i + 1)) + \
-                '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            pickle.dump(components, f)
-            f.close()
-
     if (numGames-numTraining) > 0:
-        scores = [game.state.getScore() for game in games]
-        wins = [game.state.isWin() for game in games]
-        winRate = wins.count(True) / float(len(wins))
-        print('Average Score:', sum(scores) / float(len(scores)))
-        print('Scores:       ', ', '.join([str(score) for score in scores]))
-        print('Win Rate:      %d/%d (%.2f)' %
-              (wins.count(True), len(wins), winRate))
-        print('Record:       ', ', '.join(
-            [['Loss', 'Win'][int(w)] for w in wins]))
+        printSummary([game.state.getScore() for game in games],
+                     [game.state.isWin() for game in games])
+        if stats:
+            printStats(games, layout, pacman, ghosts)
 
     return games
 
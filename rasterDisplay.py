@@ -0,0 +1,328 @@
+# rasterDisplay.py
+# ----------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+"""
+An offscreen display that needs neither Tk nor a screen.
+
+RasterGraphics has the interface of textDisplay.NullGraphics and draws
+every state it is shown into a NumPy image, one byte per pixel holding an
+index into PALETTE.  Walls are drawn once per board and cached; food is
+redrawn only when some is eaten.  Frames can be written as PNG files, to
+an animated GIF, or both:
+
+  python pacman.py -p GreedyAgent --gif game.gif
+  python pacman.py --replay recorded-game-0.rec --frameDir frames
+
+NumPy is needed for this module only.
+"""
+
+import os
+import struct
+import zlib
+from game import BitGrid
+from game import Directions
+
+try:
+    import numpy as np
+    _NUMPY_ENABLED = True
+except ImportError:
+    _NUMPY_ENABLED = False
+
+# Colours of the classic display (see graphicsDisplay.py), by palette index
+BACKGROUND, WALL, FOOD, PACMAN, SCARED, EYES = 0, 1, 2, 3, 4, 5
+GHOST_INDICES = [6, 7, 8, 9, 10, 11]
+PALETTE = [(0, 0, 0), (0, 51, 255), (255, 255, 255), (255, 255, 61),
+           (255, 255, 255), (255, 255, 255),
+           (230, 0, 0), (0, 77, 230), (250, 105, 18),
+           (26, 191, 179), (255, 153, 0), (102, 33, 232)]
+PALETTE_BITS = 4
+
+DEFAULT_CELL_SIZE = 8
+GIF_DELAY = 5  # hundredths of a second per frame
+PNG_COMPRESSION = 6
+
+
+def _bitsToCells(grid):
+    """
+    Returns a BitGrid (or Grid) as a boolean array indexed [row, column],
+    the top row of the board first, as it is drawn.
+    """
+    if not isinstance(grid, BitGrid):
+        grid = BitGrid.fromGrid(grid)
+    numCells = grid.width * grid.height
+    data = grid.bits.to_bytes((numCells + 7) // 8, 'little')
+    cells = np.unpackbits(np.frombuffer(data, dtype=np.uint8),
+                          bitorder='little')[:numCells]
+    return cells.reshape(grid.width, grid.height).T[::-1].astype(bool)
+
+
+def _disk(size, radius):
+    centre = (size - 1) / 2.0
+    y, x = np.mgrid[0:size, 0:size]
+    return (x - centre) ** 2 + (y - centre) ** 2 <= radius ** 2
+
+
+class RasterGraphics:
+    """
+    Renders games into palette-indexed NumPy images, cellSize pixels per
+    board cell.  Every frameStep-th update (and the final state of each
+    game) becomes a frame; frames go to frameDir as numbered PNG files
+    and/or to the animated GIF gifFile.  The GIF of a second game on the
+    same display is written next to the first, as NAME-2.gif and so on.
+
+    getFrame() returns the last frame as an RGB array, for callers that
+    want the pixels rather than files.
+    """
+
+    # Wall layers by (layout content hash, cell size), shared by displays
+    wallLayers = {}
+
+    def __init__(self, cellSize=DEFAULT_CELL_SIZE, frameDir=None, gifFile=None,
+                 frameStep=1, gifDelay=GIF_DELAY):
+        if not _NUMPY_ENABLED:
+            raise Exception('The raster display needs NumPy')
+        self.cellSize = max(1, int(cellSize))
+        self.frameDir = frameDir
+        self.gifFile = gifFile
+        self.frameStep = max(1, int(frameStep))
+        self.gifDelay = gifDelay
+        self.palette = np.array(PALETTE, dtype=np.uint8)
+        self.numFrames = 0
+        self.numGames = 0
+        self.gif = None
+        self.frame = None
+        self._makeSprites()
+
+    def _makeSprites(self):
+        size = self.cellSize
+        centre = (size - 1) / 2.0
+        y, x = np.mgrid[0:size, 0:size]
+        self.foodSprite = _disk(size, max(0.5, size * 0.1))
+        self.capsuleSprite = _disk(size, max(0.5, size * 0.3))
+        body = _disk(size, size * 0.45)
+        # Pacman's mouth: a wedge opening the way it faces
+        dx, dy = x - centre, centre - y
+        self.pacmanSprites = {Directions.STOP: body}
+        for direction, (ux, uy) in [(Directions.NORTH, (0, 1)), (Directions.SOUTH, (0, -1)),
+                                    (Directions.EAST, (1, 0)), (Directions.WEST, (-1, 0))]:
+            along = dx * ux + dy * uy
+            across = abs(dx * uy - dy * ux)
+            self.pacmanSprites[direction] = body & ~((along > 0) & (across < along * 0.6))
+        # Ghosts: a round head on a square skirt, with two eyes
+        self.ghostSprite = body | ((y >= centre) & (abs(x - centre) <= size * 0.45))
+        eye = max(1, size // 6)
+        self.eyeSprite = np.zeros((size, size), dtype=bool)
+        top = max(0, int(centre - size * 0.15))
+        for left in (int(centre - size * 0.25), int(centre + size * 0.1)):
+            self.eyeSprite[top:top + eye, max(0, left):max(0, left) + eye] = True
+
+    def initialize(self, state, isBlue=False):
+        layout = state.layout
+        self.width, self.height = layout.width, layout.height
+        key = (layout.getContentHash(), self.cellSize)
+        if key not in RasterGraphics.wallLayers:
+            walls = _bitsToCells(layout.walls)
+            RasterGraphics.wallLayers[key] = np.where(
+                self._expand(walls), WALL, BACKGROUND).astype(np.uint8)
+        self.wallLayer = RasterGraphics.wallLayers[key]
+        self.foodPattern = np.tile(self.foodSprite, (self.height, self.width))
+        self.foodBits = None
+        self.foodPixels = None
+        self.numUpdates = 0
+        self.numGames += 1
+        if self.gifFile:
+            fname = self.gifFile
+            if self.numGames > 1:
+                base, extension = os.path.splitext(self.gifFile)
+                fname = '%s-%d%s' % (base, self.numGames, extension)
+            self.gif = GifWriter(fname, self.wallLayer.shape[1], self.wallLayer.shape[0],
+                                 PALETTE, PALETTE_BITS, self.gifDelay)
+        if self.frameDir and not os.path.exists(self.frameDir):
+            os.makedirs(self.frameDir)
+        self.lastState = state
+        self._showFrame(state)
+
+    def _expand(self, cells):
+        size = self.cellSize
+        return np.repeat(np.repeat(cells, size, axis=0), size, axis=1)
+
+    def update(self, state):
+        self.lastState = state
+        self.numUpdates += 1
+        if self.numUpdates % self.frameStep == 0:
+            self._showFrame(state)
+
+    def render(self, state):
+        """
+        Draws state into self.frame, and returns it.
+        """
+        frame = self.wallLayer.copy()
+        food = state.food
+        bits = food.bits if isinstance(food, BitGrid) else BitGrid.fromGrid(food).bits
+        if bits != self.foodBits:
+            self.foodBits = bits
+            self.foodPixels = self._expand(_bitsToCells(food)) & self.foodPattern
+        frame[self.foodPixels] = FOOD
+        for pos in state.capsules:
+            self._drawSprite(frame, pos, self.capsuleSprite, FOOD)
+        for agentIndex, agentState in enumerate(state.agentStates):
+            config = agentState.configuration
+            if config is None:
+                continue
+            if agentState.isPacman:
+                sprite = self.pacmanSprites.get(config.direction, self.pacmanSprites[Directions.STOP])
+                self._drawSprite(frame, config.pos, sprite, PACMAN)
+            else:
+                color = GHOST_INDICES[agentIndex % len(GHOST_INDICES)]
+                if agentState.scaredTimer > 0:
+                    color = SCARED
+                self._drawSprite(frame, config.pos, self.ghostSprite, color)
+                self._drawSprite(frame, config.pos, self.eyeSprite,
+                                 BACKGROUND if color == SCARED else EYES)
+        self.frame = frame
+        return frame
+
+    def _drawSprite(self, frame, pos, sprite, color):
+        size = self.cellSize
+        x, y = pos
+        top = int(round((self.height - 1 - y) * size))
+        left = int(round(x * size))
+        rows, cols = frame.shape
+        if top >= rows or left >= cols or top + size <= 0 or left + size <= 0:
+            return
+        # Clip sprites hanging over the edge of the board
+        spriteTop, spriteLeft = max(0, -top), max(0, -left)
+        top, left = max(0, top), max(0, left)
+        bottom, right = min(rows, top + size - spriteTop), min(cols, left + size - spriteLeft)
+        mask = sprite[spriteTop:spriteTop + bottom - top, spriteLeft:spriteLeft + right - left]
+        frame[top:bottom, left:right][mask] = color
+
+    def _showFrame(self, state):
+        frame = self.render(state)
+        self.lastShown = state
+        if self.gif is not None:
+            self.gif.addFrame(frame)
+        if self.frameDir:
+            writePng(os.path.join(self.frameDir, 'frame_%08d.png' % self.numFrames),
+                     self.palette[frame])
+        self.numFrames += 1
+
+    def getFrame(self):
+        """
+        Returns the last frame drawn as an RGB array of shape (rows,
+        columns, 3).
+        """
+        if self.frame is None:
+            return None
+        return self.palette[self.frame]
+
+    def checkNullDisplay(self):
+        return True
+
+    def pause(self):
+        pass
+
+    def draw(self, state):
+        self.render(state)
+
+    def updateDistributions(self, dist):
+        pass
+
+    def finish(self):
+        if self.lastState is not self.lastShown:
+            self._showFrame(self.lastState)
+        if self.gif is not None:
+            self.gif.close()
+            self.gif = None
+
+
+def writePng(fname, rgb):
+    """
+    Writes an RGB array of shape (rows, columns, 3) as a PNG file.
+    """
+    rows, cols = rgb.shape[:2]
+    raw = np.zeros((rows, cols * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgb.reshape(rows, cols * 3)
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF))
+    f = open(fname, 'wb')
+    try:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', cols, rows, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), PNG_COMPRESSION)))
+        f.write(chunk(b'IEND', b''))
+    finally:
+        f.close()
+
+
+class GifWriter:
+    """
+    Streams palette-indexed frames to an animated GIF that loops forever.
+
+    Only the rectangle that changed since the previous frame is stored.
+    Pixels are LZW coded as plain literals with a clear code before the
+    table would outgrow the starting code size, which keeps every code the
+    same width so NumPy can pack a whole frame at once; the file is larger
+    than a fully compressed GIF, but writing costs next to nothing.
+    """
+
+    def __init__(self, fname, width, height, palette, paletteBits, delay=GIF_DELAY):
+        self.paletteBits = max(2, paletteBits)
+        self.delay = delay
+        self.previous = None
+        colors = list(palette) + [(0, 0, 0)] * ((1 << self.paletteBits) - len(palette))
+        self.file = open(fname, 'wb')
+        self.file.write(b'GIF89a')
+        self.file.write(struct.pack('<HHBBB', width, height,
+                                    0xF0 | (self.paletteBits - 1), 0, 0))
+        self.file.write(bytes(c for color in colors for c in color))
+        self.file.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+
+    def addFrame(self, frame):
+        top, left, bottom, right = 0, 0, frame.shape[0], frame.shape[1]
+        if self.previous is not None:
+            changed = frame != self.previous
+            rows, cols = np.flatnonzero(changed.any(axis=1)), np.flatnonzero(changed.any(axis=0))
+            if len(rows) == 0:
+                # Nothing changed; store one pixel so the frame keeps its time
+                rows, cols = np.array([0]), np.array([0])
+            top, bottom = rows[0], rows[-1] + 1
+            left, right = cols[0], cols[-1] + 1
+        self.previous = frame.copy()
+        pixels = frame[top:bottom, left:right]
+        f = self.file
+        f.write(struct.pack('<BBBBHBB', 0x21, 0xF9, 4, 0x04, self.delay, 0, 0))
+        f.write(struct.pack('<BHHHHB', 0x2C, left, top, right - left, bottom - top, 0))
+        f.write(bytes((self.paletteBits,)))
+        data = self._encode(pixels.ravel())
+        blocks = [data[i:i + 255] for i in range(0, len(data), 255)]
+        f.write(b''.join([bytes((len(block),)) + block for block in blocks]))
+        f.write(b'\x00')
+
+    def _encode(self, pixels):
+        clear = 1 << self.paletteBits
+        width = self.paletteBits + 1
+        # Literals after a clear code before the code width would grow
+        run = clear - 3
+        codes = np.insert(pixels.astype(np.uint16), np.arange(0, len(pixels), run), clear)
+        codes = np.append(codes, clear + 1)
+        bits = (codes[:, None] >> np.arange(width, dtype=np.uint16)) & 1
+        return np.packbits(bits.astype(np.uint8).ravel(), bitorder='little').tobytes()
+
+    def close(self):
+        if self.file is not None:
+            self.file.write(b'\x3b')
+            self.file.close()
+            self.file = None
@@ -1,75 +1,782 @@
 from util import manhattanDistance
 from game import Directions
-import random, util
+from game import Actions
+import random, util, time
+import concurrent.futures
 
 from game import Agent
+from game import GameStateData
 from pacman import GameState
+from pacman import RolloutState
+import layout
+import math
+import ghostAgents
+
+try:
+    import numpy as np
+    _NUMPY_ENABLED = True
+except ImportError:
+    _NUMPY_ENABLED = False
+
+def parseFlag(value):
+    """
+    Converte um argumento de agente (string vinda de -a, ou 1 quando a
+    opção é passada sem valor) em booleano.
+    """
+    return str(value).lower() in ('true', '1', 'yes')
+
 
 class MinimaxAgent(Agent): 
-    
-    def __init__(self, evalFn = 'betterEvaluationFunction', depth = '2'):
+    # Folhas avaliadas por chamada na avaliação em lote
+    BATCH_SIZE = 4096
+
+    def __init__(self, evalFn = 'betterEvaluationFunction', depth = '2',
+                 transposition = 'False', tableSize = '100000', replacement = 'lru',
+                 workers = '0', splitDepth = '1', batch = 'False'):
         self.index = 0
+        self.evalFn = evalFn
         self.evaluationFunction = util.lookup(evalFn, globals())
         self.depth = int(depth)
+        # Tabela de transposição opcional: guarda o valor minimax de cada
+        # (estado, agente, profundidade restante) e é mantida entre jogadas.
+        self.transpositionTable = None
+        if parseFlag(transposition):
+            self.transpositionTable = util.TranspositionTable(
+                int(tableSize), replacement)
+        # Busca paralela opcional: as subárvores abaixo de splitDepth
+        # jogadas (1 = cada ação do Pac-Man) vão para um pool de processos
+        # que dura o jogo inteiro.
+        self.workers = int(workers)
+        self.splitDepth = max(1, int(splitDepth))
+        self.pool = None
+        self.poolLayoutText = None
+        # Avaliação em lote opcional: as folhas da árvore são juntadas e
+        # avaliadas de uma vez pela versão NumPy da função de avaliação.
+        self.batchEvaluationFunction = None
+        if parseFlag(batch):
+            if not _NUMPY_ENABLED:
+                raise Exception('batch=True requires NumPy')
+            if self.transpositionTable is not None or self.workers > 0:
+                raise Exception('batch cannot be combined with '
+                                'transposition or workers')
+            self.batchEvaluationFunction = getattr(
+                self.evaluationFunction, 'batched', None)
+            if self.batchEvaluationFunction is None:
+                raise Exception('%s has no batched version' % evalFn)
+
+    def registerInitialState(self, gameState: GameState):
+        """
+        Um novo jogo começa: valores de jogos anteriores não valem mais.
+        """
+        if self.transpositionTable is not None:
+            self.transpositionTable.clear()
+        if self.workers > 0:
+            self.startPool(gameState)
 
+    def final(self, gameState: GameState):
+        """
+        Ao fim do jogo, mostra as estatísticas da tabela de transposição
+        e encerra o pool de processos.
+        """
+        if self.transpositionTable is not None:
+            stats = self.transpositionTable.getStats()
+            print('Transposition table: %(hits)d hits, %(misses)d misses '
+                  '(%(hitRate).2f), %(size)d/%(maxSize)d entries, '
+                  '%(evictions)d evictions' % stats)
+        self.stopPool()
 
     def getAction(self, gameState: GameState):
         """
         Método principal que inicia a busca Minimax.
         Retorna a melhor AÇÃO do Pac-Man (Agente 0) no estado atual.
         """
+        if self.workers > 0:
+            return self.parallelMinimax(gameState)
+        if self.batchEvaluationFunction is not None:
+            return self.batchedMinimax(gameState)
+        return self.minimax(gameState, self.index, 0)
 
-        def minimax(state, agentIndex, depth):
-            if state.isWin() or state.isLose() or depth == self.depth:
-                return self.evaluationFunction(state) 
+    def minimax(self, state, agentIndex, depth):
+        """
+        Valor minimax de state; na raiz (Pac-Man, depth 0) devolve a ação.
+        """
+        table = self.transpositionTable
+        if state.isWin() or state.isLose() or depth == self.depth:
+            return self.evaluationFunction(state) 
+
+        # A raiz precisa devolver uma ação, então nunca vem da tabela.
+        key = None
+        if table is not None and depth > 0:
+            key = (hash(state), agentIndex, self.depth - depth)
+            value = table.get(key)
+            if value is not None:
+                return value
+        
+        legalActions = state.getLegalActions(agentIndex)
+        
+        if not legalActions:
+            return self.evaluationFunction(state) 
+
+        nextAgent, nextDepth = self.nextTurn(state, agentIndex, depth)
+
+        if agentIndex == self.index: 
             
-            legalActions = state.getLegalActions(agentIndex)
+            max_value = -float('inf') 
             
-            if not legalActions:
-                return self.evaluationFunction(state) 
+            is_root = (depth == 0) 
+            if is_root:
+                best_action = Directions.STOP 
 
-            numAgents = state.getNumAgents()
-            
-            if agentIndex == (numAgents - 1): 
-                nextAgent = self.index       
-                nextDepth = depth + 1       
-            else: 
-                nextAgent = agentIndex + 1   
-                nextDepth = depth           
-
-            if agentIndex == self.index: 
-                
-                max_value = -float('inf') 
+            for action in legalActions:
+                successor = state.generateSuccessor(agentIndex, action)
+                score = self.minimax(successor, nextAgent, nextDepth)
                 
-                is_root = (depth == 0) 
-                if is_root:
-                    best_action = Directions.STOP 
-
-                for action in legalActions:
-                    successor = state.generateSuccessor(agentIndex, action)
-                    score = minimax(successor, nextAgent, nextDepth)
-                    
-                    if score > max_value:
-                        max_value = score
-                        if is_root:
-                            best_action = action 
-                
-                return best_action if is_root else max_value
+                if score > max_value:
+                    max_value = score
+                    if is_root:
+                        best_action = action 
+            
+            if is_root:
+                return best_action
+            if key is not None:
+                table.put(key, max_value, self.depth - depth)
+            return max_value
+
+        else: 
+            
+            min_value = float('inf')
 
-            else: 
+            for action in legalActions:
+                successor = state.generateSuccessor(agentIndex, action)
+                score = self.minimax(successor, nextAgent, nextDepth)
                 
-                min_value = float('inf')
+                if score < min_value:
+                    min_value = score
+
+            if key is not None:
+                table.put(key, min_value, self.depth - depth)
+            return min_value
+
+    def nextTurn(self, state, agentIndex, depth):
+        """
+        Quem joga depois de agentIndex, e em que profundidade.
+        """
+        if agentIndex == (state.getNumAgents() - 1): 
+            return self.index, depth + 1
+        return agentIndex + 1, depth
+
+    def startPool(self, gameState):
+        """
+        Cria o pool de processos.  Cada processo monta o Layout uma única
+        vez, a partir do texto, e depois só recebe estados compactados.
+        """
+        layoutText = gameState.data.layout.layoutText
+        if self.pool is not None and self.poolLayoutText == layoutText:
+            return
+        self.stopPool()
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_initWorker,
+            initargs=(layoutText,))
+        self.poolLayoutText = layoutText
+
+    def stopPool(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+            self.poolLayoutText = None
+
+    def parallelMinimax(self, gameState):
+        """
+        Mesma decisão de minimax(), mas com as subárvores calculadas no
+        pool.  As ações são comparadas na mesma ordem, com a mesma regra de
+        desempate, então a ação escolhida é idêntica à da busca serial.
+        """
+        if (gameState.isWin() or gameState.isLose() or self.depth == 0
+                or not gameState.getLegalActions(self.index)):
+            return self.minimax(gameState, self.index, 0)
+        self.startPool(gameState)
+
+        jobs = []
+        tree = self.splitTree(gameState, self.index, 0, self.splitDepth, jobs)
+        futures = [self.pool.submit(_searchSubtree, packed, agentIndex, depth,
+                                    self.evalFn, self.depth)
+                   for packed, agentIndex, depth in jobs]
+        values = [future.result() for future in futures]
+        return self.combineTree(tree, values, True)
+
+    def batchedMinimax(self, gameState):
+        """
+        Mesma decisão de minimax(), mas a árvore inteira é expandida antes,
+        e as folhas são avaliadas em lotes de BATCH_SIZE estados por uma
+        única chamada vetorizada.
+        """
+        leaves = []
+        tree = self.splitTree(gameState, self.index, 0, -1, None, leaves)
+        if tree[0] != 'node':
+            return Directions.STOP
+        leafValues = []
+        for start in range(0, len(leaves), self.BATCH_SIZE):
+            batch = StateBatch(leaves[start:start + self.BATCH_SIZE])
+            leafValues.extend(self.batchEvaluationFunction(batch).tolist())
+        return self.combineTree(tree, None, True, leafValues)
+
+    def splitTree(self, state, agentIndex, depth, plies, jobs, leaves=None):
+        """
+        Expande as primeiras jogadas localmente e guarda em jobs as
+        subárvores que sobram, como (estado compactado, agente, depth).
+        Com leaves, as folhas não são avaliadas: os estados vão para a
+        lista, para serem avaliados depois em lote.
+        """
+        if state.isWin() or state.isLose() or depth == self.depth:
+            return self.leafNode(state, leaves)
+        if plies == 0:
+            jobs.append((state.data.pack(), agentIndex, depth))
+            return ('job', len(jobs) - 1)
+        legalActions = state.getLegalActions(agentIndex)
+        if not legalActions:
+            return self.leafNode(state, leaves)
+        nextAgent, nextDepth = self.nextTurn(state, agentIndex, depth)
+        children = []
+        for action in legalActions:
+            successor = state.generateSuccessor(agentIndex, action)
+            children.append((action, self.splitTree(
+                successor, nextAgent, nextDepth, plies - 1, jobs, leaves)))
+        return ('node', agentIndex, children)
+
+    def leafNode(self, state, leaves):
+        if leaves is not None:
+            leaves.append(state)
+            return ('leaf', len(leaves) - 1)
+        return ('value', self.evaluationFunction(state))
+
+    def combineTree(self, node, values, isRoot, leafValues=None):
+        if node[0] == 'value':
+            return node[1]
+        if node[0] == 'job':
+            return values[node[1]]
+        if node[0] == 'leaf':
+            return leafValues[node[1]]
+        agentIndex, children = node[1], node[2]
+        if agentIndex == self.index:
+            max_value = -float('inf')
+            best_action = Directions.STOP
+            for action, child in children:
+                score = self.combineTree(child, values, False, leafValues)
+                if score > max_value:
+                    max_value = score
+                    best_action = action
+            return best_action if isRoot else max_value
+        return min([float('inf')] + [self.combineTree(child, values, False, leafValues)
+                                     for action, child in children])
+
+
+# Estado de cada processo do pool da busca paralela.
+_workerLayout = None
+_workerAgents = {}
+
+
+def _initWorker(layoutText):
+    global _workerLayout
+    _workerLayout = layout.Layout(layoutText)
+
+
+def _searchSubtree(packed, agentIndex, depth, evalFn, maxDepth):
+    """
+    Roda num processo do pool: valor minimax de uma subárvore.
+    """
+    key = (evalFn, maxDepth)
+    if key not in _workerAgents:
+        _workerAgents[key] = MinimaxAgent(evalFn, maxDepth)
+    state = GameState()
+    state.data = GameStateData.unpack(_workerLayout, packed)
+    return _workerAgents[key].minimax(state, agentIndex, depth)
+
+
+class SearchTimeout(Exception):
+    """
+    Interrompe uma iteração do aprofundamento iterativo quando o tempo acaba.
+    """
+    pass
+
+
+class AlphaBetaAgent(Agent):
+    """
+    Minimax com poda alfa-beta e aprofundamento iterativo.
+
+    Cada jogada busca com profundidade 1, 2, ... até self.depth ou até
+    esgotar o orçamento de tempo, e devolve a melhor ação da iteração mais
+    profunda que terminou.  As ações são ordenadas pela melhor ação da
+    iteração anterior (na raiz), pelas jogadas "killer" de cada nível e
+    pela heurística de histórico, o que faz a poda cortar bem mais cedo.
+
+    O orçamento é timeLimit segundos por jogada (DEFAULT_TIME_LIMIT se
+    omitido), limitado a uma fração do tempo máximo por jogada das regras
+    (ClassicGameRules.getMoveTimeout, ou seja, --timeout), que as regras
+    informam via setMoveTimeout.
+    """
+
+    DEFAULT_TIME_LIMIT = 1.0
+    MOVE_TIMEOUT_FRACTION = 0.5
+    NUM_KILLERS = 2
+    NODES_PER_TIME_CHECK = 256
+
+    def __init__(self, evalFn = 'betterEvaluationFunction', depth = '6', timeLimit = None):
+        self.index = 0
+        self.evaluationFunction = util.lookup(evalFn, globals())
+        self.depth = int(depth)
+        self.timeLimit = float(timeLimit) if timeLimit is not None else None
+        self.moveTimeout = None
+        self.history = util.Counter()
+        self.completedDepth = 0
+
+    def setMoveTimeout(self, timeout):
+        """
+        Chamado pelas regras com o tempo máximo (em segundos) por jogada.
+        """
+        self.moveTimeout = timeout
+
+    def registerInitialState(self, gameState: GameState):
+        self.history = util.Counter()
+
+    def getTimeBudget(self):
+        """
+        Segundos disponíveis para a jogada atual.
+        """
+        limit = self.timeLimit
+        if limit is None:
+            limit = self.DEFAULT_TIME_LIMIT
+        if self.moveTimeout is not None:
+            limit = min(limit, self.moveTimeout * self.MOVE_TIMEOUT_FRACTION)
+        return limit
+
+    def getAction(self, gameState: GameState):
+        """
+        Aprofundamento iterativo: devolve a melhor ação da iteração mais
+        profunda concluída dentro do orçamento de tempo.
+        """
+        self.deadline = time.time() + self.getTimeBudget()
+        self.killers = {}
+        self.nodes = 0
+        self.completedDepth = 0
+
+        legalActions = gameState.getLegalActions(self.index)
+        if not legalActions:
+            return Directions.STOP
+        bestAction = legalActions[0]
+
+        for depth in range(1, self.depth + 1):
+            # A primeira iteração sempre termina, para haver uma resposta.
+            self.canTimeOut = depth > 1
+            try:
+                bestAction = self.searchRoot(gameState, depth, bestAction)
+            except SearchTimeout:
+                break
+            self.completedDepth = depth
+        return bestAction
+
+    def searchRoot(self, gameState, depth, previousBest):
+        legalActions = gameState.getLegalActions(self.index)
+        # A melhor ação da iteração anterior é testada primeiro.
+        ordered = [previousBest] if previousBest in legalActions else []
+        ordered += [a for a in self.orderActions(self.index, 0, legalActions)
+                    if a != previousBest]
+
+        alpha = -float('inf')
+        bestValue = -float('inf')
+        bestAction = ordered[0]
+        nextAgent = (self.index + 1) % gameState.getNumAgents()
+        nextDepth = depth - 1 if nextAgent == self.index else depth
+        for action in ordered:
+            successor = gameState.generateSuccessor(self.index, action)
+            value = self.alphaBeta(successor, nextAgent, nextDepth, 1,
+                                   alpha, float('inf'))
+            if value > bestValue:
+                bestValue = value
+                bestAction = action
+            alpha = max(alpha, value)
+        return bestAction
+
+    def alphaBeta(self, state, agentIndex, depth, ply, alpha, beta):
+        """
+        Valor minimax de state com poda alfa-beta.  depth é o número de
+        rodadas completas (todos os agentes jogando) que ainda faltam.
+        """
+        self.nodes += 1
+        if (self.canTimeOut and self.nodes % self.NODES_PER_TIME_CHECK == 0
+                and time.time() > self.deadline):
+            raise SearchTimeout()
+
+        if state.isWin() or state.isLose() or depth == 0:
+            return self.evaluationFunction(state)
+
+        legalActions = state.getLegalActions(agentIndex)
+        if not legalActions:
+            return self.evaluationFunction(state)
+
+        nextAgent = (agentIndex + 1) % state.getNumAgents()
+        nextDepth = depth - 1 if nextAgent == self.index else depth
+        isMax = agentIndex == self.index
 
-                for action in legalActions:
-                    successor = state.generateSuccessor(agentIndex, action)
-                    score = minimax(successor, nextAgent, nextDepth)
-                    
-                    if score < min_value:
-                        min_value = score
-                        
-                return min_value
+        value = -float('inf') if isMax else float('inf')
+        for action in self.orderActions(agentIndex, ply, legalActions):
+            successor = state.generateSuccessor(agentIndex, action)
+            score = self.alphaBeta(successor, nextAgent, nextDepth, ply + 1,
+                                   alpha, beta)
+            if isMax:
+                value = max(value, score)
+                alpha = max(alpha, value)
+            else:
+                value = min(value, score)
+                beta = min(beta, value)
+            if alpha >= beta:
+                self.recordCutoff(agentIndex, ply, depth, action)
+                break
+        return value
 
-        return minimax(gameState, self.index, 0) 
+    def orderActions(self, agentIndex, ply, legalActions):
+        """
+        Jogadas killer do nível primeiro, depois as demais por histórico.
+        """
+        killers = [a for a in self.killers.get(ply, ()) if a in legalActions]
+        rest = [a for a in legalActions if a not in killers]
+        rest.sort(key=lambda a: -self.history[(agentIndex, a)])
+        return killers + rest
+
+    def recordCutoff(self, agentIndex, ply, depth, action):
+        killers = self.killers.setdefault(ply, [])
+        if action not in killers:
+            killers.insert(0, action)
+            del killers[self.NUM_KILLERS:]
+        self.history[(agentIndex, action)] += depth * depth
+
+
+class ExpectimaxAgent(Agent):
+    """
+    Expectimax: os fantasmas não são adversários perfeitos, e sim nós de
+    acaso que seguem a distribuição (getDistribution) dos fantasmas que
+    estão de fato no jogo, informados pelas regras via setGhostAgents.
+    Sem essa informação, supõe RandomGhost.
+
+    As distribuições são guardadas por (posição e direção do fantasma,
+    posição do Pac-Man, assustado), o que vale para RandomGhost e
+    DirectionalGhost.  Ramos com probabilidade abaixo de threshold são
+    podados e as probabilidades restantes renormalizadas; com threshold 0
+    a busca é exata.
+    """
+
+    # Fantasmas cuja distribuição só depende da chave do cache
+    CACHEABLE_GHOSTS = (ghostAgents.RandomGhost, ghostAgents.DirectionalGhost)
+
+    def __init__(self, evalFn = 'betterEvaluationFunction', depth = '2', threshold = '0'):
+        self.index = 0
+        self.evaluationFunction = util.lookup(evalFn, globals())
+        self.depth = int(depth)
+        self.threshold = float(threshold)
+        self.ghostModels = {}
+        self.distributionCache = {}
+
+    def setGhostAgents(self, ghosts):
+        """
+        Chamado pelas regras com os agentes fantasmas do jogo.
+        """
+        self.ghostModels = dict((ghost.index, ghost) for ghost in ghosts if ghost)
+        self.distributionCache = {}
+
+    def registerInitialState(self, gameState: GameState):
+        self.distributionCache = {}
+
+    def getAction(self, gameState: GameState):
+        best_value = -float('inf')
+        best_action = Directions.STOP
+        nextAgent, nextDepth = self.nextTurn(gameState, self.index, 0)
+        for action in gameState.getLegalActions(self.index):
+            successor = gameState.generateSuccessor(self.index, action)
+            value = self.expectimax(successor, nextAgent, nextDepth)
+            if value > best_value:
+                best_value = value
+                best_action = action
+        return best_action
+
+    def nextTurn(self, state, agentIndex, depth):
+        if agentIndex == (state.getNumAgents() - 1):
+            return self.index, depth + 1
+        return agentIndex + 1, depth
+
+    def expectimax(self, state, agentIndex, depth):
+        if state.isWin() or state.isLose() or depth == self.depth:
+            return self.evaluationFunction(state)
+        nextAgent, nextDepth = self.nextTurn(state, agentIndex, depth)
+
+        if agentIndex == self.index:
+            legalActions = state.getLegalActions(agentIndex)
+            if not legalActions:
+                return self.evaluationFunction(state)
+            return max([self.expectimax(state.generateSuccessor(agentIndex, action),
+                                        nextAgent, nextDepth)
+                        for action in legalActions])
+
+        distribution = self.getGhostDistribution(state, agentIndex)
+        if not distribution:
+            return self.evaluationFunction(state)
+        value = 0.0
+        for action, prob in distribution:
+            successor = state.generateSuccessor(agentIndex, action)
+            value += prob * self.expectimax(successor, nextAgent, nextDepth)
+        return value
+
+    def getGhostModel(self, agentIndex):
+        if agentIndex not in self.ghostModels:
+            self.ghostModels[agentIndex] = ghostAgents.RandomGhost(agentIndex)
+        return self.ghostModels[agentIndex]
+
+    def getGhostDistribution(self, state, agentIndex):
+        """
+        Lista de (ação, probabilidade) do fantasma agentIndex, já podada.
+        """
+        ghost = self.getGhostModel(agentIndex)
+        if not isinstance(ghost, self.CACHEABLE_GHOSTS):
+            return self.pruneDistribution(ghost.getDistribution(state))
+        ghostState = state.data.agentStates[agentIndex]
+        config = ghostState.configuration
+        key = (agentIndex, config.pos, config.direction,
+               state.getPacmanPosition(), ghostState.scaredTimer > 0)
+        distribution = self.distributionCache.get(key)
+        if distribution is None:
+            distribution = self.pruneDistribution(ghost.getDistribution(state))
+            self.distributionCache[key] = distribution
+        return distribution
+
+    def pruneDistribution(self, dist):
+        """
+        Remove as ações com probabilidade abaixo de threshold (mantendo ao
+        menos a mais provável) e renormaliza o resto.
+        """
+        outcomes = [(action, prob) for action, prob in dist.items() if prob > 0]
+        if not outcomes:
+            return []
+        kept = [(action, prob) for action, prob in outcomes if prob >= self.threshold]
+        if not kept:
+            kept = [max(outcomes, key=lambda outcome: outcome[1])]
+        total = sum([prob for action, prob in kept])
+        return [(action, prob / total) for action, prob in kept]
+
+
+class MCTSNode:
+    """
+    Nó da árvore do MCTS.  Os nós de decisão têm em children um filho por
+    ação do Pac-Man; cada filho guarda em outcomes um nó de decisão por
+    resposta dos fantasmas já sorteada (posições, direções e timers).
+    """
+    __slots__ = ('children', 'outcomes', 'visits', 'total')
+
+    def __init__(self):
+        self.children = None
+        self.outcomes = {}
+        self.visits = 0
+        self.total = 0.0
+
+
+class MCTSAgent(Agent):
+    """
+    Monte Carlo Tree Search com UCT.
+
+    Cada jogada roda simulações até esgotar playouts (se positivo) ou o
+    orçamento de tempo (timeLimit segundos, limitado por uma fração do
+    --timeout como no AlphaBetaAgent).  As simulações usam RolloutState, que
+    avança o jogo no lugar, sem cópias nem validação.  Os fantasmas jogam ao
+    acaso; o Pac-Man, fora da árvore, segue rolloutPolicy ('random' ou
+    'greedy', que prefere casas com comida) por até rolloutDepth jogadas.
+    O valor de uma simulação é a variação do placar, e exploration é a
+    constante do UCT, na mesma escala de pontos.
+
+    A subárvore da ação escolhida é mantida para a jogada seguinte: a
+    resposta que os fantasmas de fato deram vira a nova raiz.
+    """
+
+    DEFAULT_TIME_LIMIT = 1.0
+    MOVE_TIMEOUT_FRACTION = 0.5
+    PLAYOUTS_PER_TIME_CHECK = 16
+
+    def __init__(self, exploration = '50', rolloutPolicy = 'greedy', rolloutDepth = '20',
+                 playouts = '0', timeLimit = None, seed = None):
+        self.index = 0
+        self.exploration = float(exploration)
+        if rolloutPolicy not in ('random', 'greedy'):
+            raise Exception('Unknown rollout policy: ' + rolloutPolicy)
+        self.rolloutPolicy = rolloutPolicy
+        self.rolloutDepth = int(rolloutDepth)
+        self.playouts = int(playouts)
+        self.timeLimit = float(timeLimit) if timeLimit is not None else None
+        self.moveTimeout = None
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.random = random.Random(seed)
+        self.root = None
+        self.totalPlayouts = 0
+
+    def setMoveTimeout(self, timeout):
+        """
+        Chamado pelas regras com o tempo máximo (em segundos) por jogada.
+        """
+        self.moveTimeout = timeout
+
+    def registerInitialState(self, gameState: GameState):
+        self.root = None
+
+    def getTimeBudget(self):
+        """
+        Segundos disponíveis para a jogada atual.
+        """
+        limit = self.timeLimit
+        if limit is None:
+            limit = self.DEFAULT_TIME_LIMIT
+        if self.moveTimeout is not None:
+            limit = min(limit, self.moveTimeout * self.MOVE_TIMEOUT_FRACTION)
+        return limit
+
+    def getAction(self, gameState: GameState):
+        start = RolloutState(gameState)
+        legalActions = self.treeActions(start)
+        root = None
+        if self.root is not None:
+            root = self.root.outcomes.get(self.outcomeKey(start))
+        # A subárvore guardada só serve se continua do mesmo ponto.
+        if root is None or root.children is None or list(root.children) != legalActions:
+            root = MCTSNode()
+
+        if self.playouts > 0:
+            for i in range(self.playouts):
+                self.simulate(root, start)
+        else:
+            deadline = time.time() + self.getTimeBudget()
+            while True:
+                for i in range(self.PLAYOUTS_PER_TIME_CHECK):
+                    self.simulate(root, start)
+                if time.time() >= deadline:
+                    break
+
+        # A ação mais visitada; em empate, a primeira.
+        best_action, best_child = None, None
+        for action, child in root.children.items():
+            if best_child is None or child.visits > best_child.visits:
+                best_action, best_child = action, child
+        self.root = best_child
+        return best_action
+
+    def treeActions(self, state):
+        """
+        Ações do Pac-Man na árvore: parar só quando não há outra opção.
+        """
+        actions = [a for a in state.pacmanActions() if a != Directions.STOP]
+        if not actions:
+            return [Directions.STOP]
+        return actions
+
+    def simulate(self, root, start):
+        """
+        Uma iteração: seleção e expansão pelo UCT, simulação e
+        retropropagação.
+        """
+        state = start.copy()
+        node = root
+        path = [root]
+        while not state.isTerminal():
+            if node.children is None:
+                node.children = dict((a, MCTSNode()) for a in self.treeActions(state))
+            action, child = self.selectChild(node)
+            path.append(child)
+            self.step(state, action)
+            key = self.outcomeKey(state)
+            node = child.outcomes.get(key)
+            if node is None:
+                node = child.outcomes[key] = MCTSNode()
+                path.append(node)
+                break
+            path.append(node)
+        value = self.rollout(state) - start.score
+        for node in path:
+            node.visits += 1
+            node.total += value
+        self.totalPlayouts += 1
+
+    def outcomeKey(self, state):
+        return (tuple(state.ghostPos), tuple(state.ghostDir), tuple(state.scared))
+
+    def selectChild(self, node):
+        logVisits = math.log(max(1, node.visits))
+        best, bestScore = None, -float('inf')
+        for action, child in node.children.items():
+            if child.visits == 0:
+                return action, child
+            score = (child.total / child.visits
+                     + self.exploration * math.sqrt(logVisits / child.visits))
+            if score > bestScore:
+                best, bestScore = (action, child), score
+        return best
+
+    def step(self, state, action):
+        """
+        Uma rodada completa: o Pac-Man joga action e cada fantasma joga ao acaso.
+        """
+        state.stepPacman(action)
+        for ghost in range(state.getNumAgents() - 1):
+            if state.isTerminal():
+                return
+            actions = state.ghostActions(ghost)
+            state.stepGhost(ghost, self.random.choice(actions) if actions else Directions.STOP)
+
+    def rollout(self, state):
+        for i in range(self.rolloutDepth):
+            if state.isTerminal():
+                break
+            actions = self.treeActions(state)
+            if self.rolloutPolicy == 'greedy':
+                actions = self.greedyActions(state, actions)
+            self.step(state, self.random.choice(actions))
+        if state.isTerminal():
+            return state.score
+        return state.score - self.nearestFoodDistance(state)
+
+    def greedyActions(self, state, actions):
+        """
+        Entre as ações, as que não levam para perto de um fantasma não
+        assustado e, dessas, as que comem alguma coisa.
+        """
+        x, y = state.pacman
+        safe = []
+        for action in actions:
+            dx, dy = Actions._directions[action]
+            next = (x + dx, y + dy)
+            for ghost in range(len(state.ghostPos)):
+                if state.scared[ghost] == 0 and manhattanDistance(next, state.ghostPos[ghost]) <= 1:
+                    break
+            else:
+                safe.append(action)
+        if safe:
+            actions = safe
+        eating = [a for a in actions if state.hasFood(
+            (x + Actions._directions[a][0], y + Actions._directions[a][1]))]
+        if eating:
+            return eating
+        return actions
+
+    def nearestFoodDistance(self, state):
+        """
+        Distância (Manhattan) do Pac-Man à comida mais próxima, para que
+        simulações que não alcançam comida ainda prefiram chegar perto.
+        """
+        x, y = state.pacman
+        height = state.height
+        bits = state.foodBits
+        best = 0
+        while bits:
+            low = bits & -bits
+            fx, fy = divmod(low.bit_length() - 1, height)
+            distance = abs(fx - x) + abs(fy - y)
+            if best == 0 or distance < best:
+                best = distance
+            bits ^= low
+        return best
 
 
 def betterEvaluationFunction(currentGameState: GameState):
@@ -127,4 +834,93 @@ def betterEvaluationFunction(currentGameState: GameState):
             + ghost_interaction_term 
             + capsule_bonus)
 
+
+
+class StateBatch:
+    """
+    Um lote de estados do mesmo layout codificado em arrays NumPy, para
+    funções de avaliação vetorizadas.  Para n estados e g fantasmas:
+    pacman (n, 2), ghosts (n, g, 2), scaredTimers (n, g), food (n, células)
+    com as células numeradas x * height + y como nos bits do BitGrid,
+    capsules (n, cápsulas do layout) e score (n,).
+    """
+
+    def __init__(self, states):
+        data = states[0].data
+        width, height = data.food.width, data.food.height
+        numCells = width * height
+        numGhosts = len(data.agentStates) - 1
+        n = len(states)
+        self.size = n
+        self.cellX = np.arange(numCells) // height
+        self.cellY = np.arange(numCells) % height
+        self.pacman = np.array([s.getPacmanPosition() for s in states],
+                               dtype=float).reshape(n, 2)
+        ghostStates = [s.getGhostStates() for s in states]
+        self.ghosts = np.array([[g.getPosition() for g in gs] for gs in ghostStates],
+                               dtype=float).reshape(n, numGhosts, 2)
+        self.scaredTimers = np.array([[g.scaredTimer for g in gs] for gs in ghostStates],
+                                     dtype=float).reshape(n, numGhosts)
+        numBytes = (numCells + 7) // 8
+        packed = b''.join([s.data.food.bits.to_bytes(numBytes, 'little')
+                           for s in states])
+        self.food = np.unpackbits(
+            np.frombuffer(packed, dtype=np.uint8).reshape(n, numBytes),
+            axis=1, bitorder='little')[:, :numCells].astype(bool)
+        layoutCapsules = data.layout.capsules
+        self.capsulePositions = np.array(layoutCapsules, dtype=float).reshape(-1, 2)
+        self.capsules = np.array([[c in s.data.capsules for c in layoutCapsules]
+                                  for s in states], dtype=bool).reshape(n, len(layoutCapsules))
+        self.score = np.array([s.data.score for s in states], dtype=float)
+
+
+def betterEvaluationFunctionBatch(batch):
+    """
+    Versão vetorizada de betterEvaluationFunction: recebe um StateBatch e
+    devolve um array com os mesmos valores, somados na mesma ordem.
+    """
+    inf = float('inf')
+    px, py = batch.pacman[:, 0:1], batch.pacman[:, 1:2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Só as células que têm comida em algum estado do lote.
+        cells = batch.food.any(axis=0)
+        food = batch.food[:, cells]
+        foodDistances = (np.abs(px - batch.cellX[cells])
+                         + np.abs(py - batch.cellY[cells]))
+        minFoodDistance = np.where(food, foodDistances, inf).min(
+            axis=1, initial=inf)
+        numFood = food.sum(axis=1)
+        food_seeking_term = np.where(
+            numFood > 0, (1.0 / (minFoodDistance + 1)) * 5.0, 0.0)
+        food_count_penalty = -2.0 * numFood
+
+        ghost_interaction_term = np.zeros(batch.size)
+        for g in range(batch.ghosts.shape[1]):
+            ghostDistance = (np.abs(batch.pacman[:, 0] - batch.ghosts[:, g, 0])
+                             + np.abs(batch.pacman[:, 1] - batch.ghosts[:, g, 1]))
+            scaredTime = batch.scaredTimers[:, g]
+            ghost_interaction_term = ghost_interaction_term + np.where(
+                ghostDistance == 0, -inf,
+                np.where(scaredTime == 0,
+                         np.where(ghostDistance <= 5, -2.5 / ghostDistance, 0.0),
+                         1.5 / ghostDistance))
+            ghost_interaction_term = ghost_interaction_term + np.where(
+                (ghostDistance != 0) & (scaredTime > 0) & (scaredTime < 5),
+                scaredTime / (ghostDistance * 2.0), 0.0)
+
+        capsuleDistances = (np.abs(px - batch.capsulePositions[:, 0])
+                            + np.abs(py - batch.capsulePositions[:, 1]))
+        minCapsuleDistance = np.where(batch.capsules, capsuleDistances, inf).min(
+            axis=1, initial=inf)
+        capsule_bonus = np.where(batch.capsules.any(axis=1),
+                                 10.0 / (minCapsuleDistance + 1), 0.0)
+
+    return (batch.score
+            + food_seeking_term
+            + food_count_penalty
+            + ghost_interaction_term
+            + capsule_bonus)
+
+betterEvaluationFunction.batched = betterEvaluationFunctionBatch
+
 better = betterEvaluationFunction
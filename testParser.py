@@ -12,8 +12,86 @@
 # Pieter Abbeel (pabbeel@cs.berkeley.edu).
 
 
+import atexit
+import hashlib
+import marshal
+import os
 import re
 import sys
+import util
+
+# Parsed test files are cached on disk, one marshal file per directory, so
+# repeated grading runs skip parsing.  An entry is [mtime, size, content
+# hash, test dict, derived data]; it is used as is while the file's mtime
+# and size are unchanged, and kept after a touch if its content hash still
+# matches.  Changed caches are written back when the process exits.
+_directoryCaches = {}
+_changedDirectories = set()
+
+
+def _getCacheFileName(directory):
+    key = hashlib.sha1(directory.encode()).hexdigest()
+    return os.path.join(util.CACHE_DIR, 'tests-%s-%d.bin' % (key, marshal.version))
+
+
+def _getDirectoryCache(directory):
+    if directory not in _directoryCaches:
+        try:
+            with open(_getCacheFileName(directory), 'rb') as handle:
+                cache = marshal.loads(handle.read())
+        except Exception:
+            cache = {}
+        _directoryCaches[directory] = cache
+    return _directoryCaches[directory]
+
+
+def _saveDirectoryCaches():
+    for directory in sorted(_changedDirectories):
+        util.writeCacheFile(_getCacheFileName(directory),
+                            marshal.dumps(_directoryCaches[directory]))
+    _changedDirectories.clear()
+
+
+atexit.register(_saveDirectoryCaches)
+
+
+def _getCacheEntry(path):
+    """
+    Returns the cache entry of the file at path, parsing it if it is new or
+    has changed, and the directory it is cached under.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    cache = _getDirectoryCache(directory)
+    stat = os.stat(path)
+    entry = cache.get(name)
+    if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+        return entry, directory
+    with open(path) as handle:
+        text = handle.read()
+    contentHash = hashlib.sha1(text.encode()).hexdigest()
+    if entry is not None and entry[2] == contentHash:
+        entry = [stat.st_mtime_ns, stat.st_size, contentHash, entry[3], entry[4]]
+    else:
+        entry = [stat.st_mtime_ns, stat.st_size, contentHash,
+                 TestParser(path).parseText(text), {}]
+    cache[name] = entry
+    _changedDirectories.add(directory)
+    return entry, directory
+
+
+def getDerived(testDict, name, build):
+    """
+    Returns build(testDict), cached on disk with the parsed test file that
+    testDict came from.  The result must be marshallable.
+    """
+    path = testDict.get('path')
+    if path is None or not os.path.isfile(path):
+        return build(testDict)
+    entry, directory = _getCacheEntry(path)
+    if name not in entry[4]:
+        entry[4][name] = build(testDict)
+        _changedDirectories.add(directory)
+    return entry[4][name]
 
 
 class TestParser(object):
@@ -34,10 +112,16 @@ class TestParser(object):
         return '\n'.join(fixed_lines)
 
     def parse(self):
-        # read in the test case and remove comments
+        entry, directory = _getCacheEntry(self.path)
+        # a copy, as callers add their own keys
+        test = dict(entry[3])
+        test['path'] = self.path
+        return test
+
+    def parseText(self, text):
+        # remove comments from the test case
         test = {}
-        with open(self.path) as handle:
-            raw_lines = handle.read().split('\n')
+        raw_lines = text.split('\n')
 
         test_text = self.removeComments(raw_lines)
         test['__raw_lines__'] = raw_lines
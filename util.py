@@ -27,8 +27,10 @@
 
 
 import sys
+import os
 import inspect
 import heapq
+import collections
 import random
 import io
 
@@ -233,6 +235,95 @@ class PriorityQueueWithFunction(PriorityQueue):
         PriorityQueue.push(self, item, self.priorityFunction(item))
 
 
+class TranspositionTable:
+    """
+    A bounded cache of search results, for game-tree searches that reach
+    the same position through different move orders.
+
+    Entries are stored under a key together with the search depth that
+    remained when they were computed.  Once maxSize entries are stored, a
+    new one replaces an old one according to the policy:
+
+      'lru'    evicts the least recently used entry.
+      'depth'  hashes each key to one of maxSize slots and overwrites the
+               slot only if the new entry was searched at least as deep.
+
+    Hits, misses, stores and evictions are counted; see getStats.
+    """
+
+    POLICIES = ('lru', 'depth')
+
+    def __init__(self, maxSize=100000, policy='lru'):
+        if policy not in self.POLICIES:
+            raise Exception('Unknown replacement policy: %s' % policy)
+        self.maxSize = maxSize
+        self.policy = policy
+        self.clear()
+
+    def clear(self):
+        "Removes every entry and resets the statistics"
+        if self.policy == 'lru':
+            self.entries = collections.OrderedDict()
+        else:
+            self.entries = [None] * self.maxSize
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def get(self, key):
+        "Returns the value stored for key, or None"
+        if self.policy == 'lru':
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value[0]
+        slot = self.entries[hash(key) % self.maxSize]
+        if slot is None or slot[0] != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return slot[1]
+
+    def put(self, key, value, depth=0):
+        "Stores value for key, found by a search of the given depth"
+        self.stores += 1
+        if self.policy == 'lru':
+            if key not in self.entries:
+                if self.size >= self.maxSize:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+                else:
+                    self.size += 1
+            self.entries[key] = (value, depth)
+            self.entries.move_to_end(key)
+            return
+        index = hash(key) % self.maxSize
+        slot = self.entries[index]
+        if slot is None:
+            self.size += 1
+        elif slot[0] != key:
+            if slot[2] > depth:
+                return
+            self.evictions += 1
+        self.entries[index] = (key, value, depth)
+
+    def getStats(self):
+        "Returns a dictionary with the table's counters"
+        lookups = self.hits + self.misses
+        return {'size': self.size, 'maxSize': self.maxSize,
+                'hits': self.hits, 'misses': self.misses,
+                'hitRate': self.hits / float(lookups) if lookups else 0.0,
+                'stores': self.stores, 'evictions': self.evictions}
+
+    def __len__(self):
+        return self.size
+
+
 def manhattanDistance(xy1, xy2):
     "Returns the Manhattan distance between points xy1 and xy2"
     return abs(xy1[0] - xy2[0]) + abs(xy1[1] - xy2[1])
@@ -715,3 +806,28 @@ def unmutePrint():
 
     sys.stdout = _ORIGINAL_STDOUT
     #sys.stderr = _ORIGINAL_STDERR
+
+
+# Files kept between runs: precomputed layout tables, compiled layouts and
+# parsed test files
+CACHE_DIR = os.environ.get('PACMAN_CACHE_DIR', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '.cache'))
+
+
+def writeCacheFile(fname, data):
+    """
+    Writes data to a cache file atomically.  A cache that cannot be written
+    (say, on a read-only checkout) is silently skipped.
+    """
+    tmpname = '%s.%d.tmp' % (fname, os.getpid())
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        f = open(tmpname, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+        os.replace(tmpname, fname)
+    except OSError:
+        if os.path.exists(tmpname):
+            os.remove(tmpname)